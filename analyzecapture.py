@@ -0,0 +1,138 @@
+import sys
+import zlib
+
+import rencode
+from capture import INCOMING, prefixLength, readCapture
+
+directionNames = {INCOMING: 'in', 1: 'out'}
+
+# first element of every message that is not a player update, lobby messages
+# like ('ready', (name, ready)) would pass for one otherwise
+messageTypes = frozenset(['auth', 'bundle', 'chat', 'disconnect', 'fail', 'foods', 'game', 'gamedata', 'join', 'leave',
+                          'load', 'loading', 'match', 'ping', 'pong', 'queued', 'ready', 'register', 'registered',
+                          'resume', 'roster', 'round', 'snapshot', 'tick', 'ticket', 'updateDest', 'username'])
+
+
+# Offline analyzer for net-capture-file recordings.
+# Usage: python analyzecapture.py <capture file> [number of largest records]
+class Totals(object):
+    def __init__(self):
+        self.count = 0
+        self.raw = 0
+        self.wire = 0
+        self.codecTime = 0.0
+
+    def add(self, raw, wire, codecTime):
+        self.count += 1
+        self.raw += raw
+        self.wire += wire
+        self.codecTime += codecTime
+
+    def ratio(self):
+        return float(self.wire) / self.raw if self.raw else 1.0
+
+
+def decodePayload(payload):
+    if payload[prefixLength - 1:prefixLength] == 'Z':
+        payload = rencode.HEADER + 'N' + zlib.decompress(payload[prefixLength:])
+    return rencode.loads(payload)
+
+
+def classify(message):
+    # Return (message type, player name) of a decoded message. Player updates
+    # are sent as (name, (type, data)).
+    if isinstance(message, tuple) and len(message) == 2:
+        if message[0] in messageTypes:
+            return message[0], None
+        if isinstance(message[1], tuple) and message[1] and isinstance(message[1][0], str):
+            return message[1][0], message[0]
+        if isinstance(message[0], str):
+            return message[0], None
+    return type(message).__name__, None
+
+
+def splitMessage(message):
+    # [(message, share of the record)], bundles are split between the
+    # messages they carry by their encoded size
+    if not (isinstance(message, tuple) and len(message) == 2 and message[0] == 'bundle' and message[1]):
+        return [(message, 1.0)]
+    sizes = [len(rencode.dumps(inner)) for inner in message[1]]
+    total = float(sum(sizes))
+    return [(inner, size / total) for inner, size in zip(message[1], sizes)]
+
+
+def analyze(filename, largest=10):
+    byType = {}
+    byPlayer = {}
+    byConnection = {}
+    byTick = {}
+    biggest = []
+    total = Totals()
+    tick = None
+
+    for stamp, direction, connectionId, raw, wire, codecTime, payload in readCapture(filename):
+        message = decodePayload(payload)
+        parts = splitMessage(message)
+        # the updates of a bundle are applied with the tick that follows them
+        waiting = []
+        for part, share in parts:
+            messageType, player = classify(part)
+            amounts = raw * share, wire * share, codecTime * share
+
+            key = (directionNames[direction], messageType)
+            byType.setdefault(key, Totals()).add(*amounts)
+            if player is not None:
+                byPlayer.setdefault(player, Totals()).add(*amounts)
+            waiting.append(amounts)
+            if messageType == 'tick':
+                tick = part[1]
+                for amounts in waiting:
+                    byTick.setdefault(tick, Totals()).add(*amounts)
+                waiting = []
+        if tick is not None:
+            for amounts in waiting:
+                byTick.setdefault(tick, Totals()).add(*amounts)
+        byConnection.setdefault((directionNames[direction], connectionId), Totals()).add(raw, wire, codecTime)
+        total.add(raw, wire, codecTime)
+        recordType = classify(message)[0]
+        if len(parts) > 1:
+            recordType = '%s of %d' % (recordType, len(parts))
+        biggest.append((wire, raw, directionNames[direction], connectionId, recordType))
+
+    printTable('Per message type', byType, lambda key: '%-3s %s' % key)
+    printTable('Per player', byPlayer, str)
+    printTable('Per connection', byConnection, lambda key: '%-3s #%d' % key)
+
+    print
+    print 'Per tick'
+    if byTick:
+        wires = [totals.wire for totals in byTick.values()]
+        counts = [totals.count for totals in byTick.values()]
+        print '  ticks %d, bytes/tick mean %.1f max %d, messages/tick mean %.1f max %d' % (
+            len(byTick), float(sum(wires)) / len(wires), max(wires), float(sum(counts)) / len(counts), max(counts))
+
+    print
+    print 'Largest %d records' % largest
+    biggest.sort(reverse=True)
+    for wire, raw, direction, connectionId, messageType in biggest[:largest]:
+        print '  %8d wire %8d raw  %-3s #%-4d %s' % (wire, raw, direction, connectionId, messageType)
+
+    print
+    print 'Total %d messages, %d bytes raw, %d bytes on the wire (ratio %.2f), %.3f s codec time' % (
+        total.count, total.raw, total.wire, total.ratio(), total.codecTime)
+
+
+def printTable(title, table, describe):
+    print
+    print title
+    print '  %-32s %8s %10s %10s %6s %10s' % ('', 'count', 'raw', 'wire', 'ratio', 'codec ms')
+    for key, totals in sorted(table.items(), key=lambda item: -item[1].wire):
+        print '  %-32s %8d %10d %10d %6.2f %10.2f' % (describe(key), totals.count, totals.raw, totals.wire,
+                                                     totals.ratio(), totals.codecTime * 1000)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print 'usage: python analyzecapture.py <capture file> [largest]'
+        sys.exit(1)
+    analyze(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 10)
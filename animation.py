@@ -0,0 +1,151 @@
+from direct.actor.Actor import Actor
+from panda3d.core import ConfigVariableBool, ConfigVariableDouble, ConfigVariableInt, NodePath
+
+from assets import modelPath
+
+sharedAnimation = ConfigVariableBool('shared-animation', True)
+sharedAnimationPhases = ConfigVariableInt('shared-animation-phases', 4)
+# update rate of the reduced rate masters used for mid distance LOD
+reducedAnimationRate = ConfigVariableDouble('reduced-animation-rate', 8.0)
+
+# Animation tiers, from full detail to none
+NEAR = 0
+REDUCED = 1
+FROZEN = 2
+LOW = 3
+
+
+# InstancedActor Class
+# A node that instances the geometry and skeleton of a master Actor, so every
+# instance is posed by the masters single animation control
+class InstancedActor(NodePath):
+    def __init__(self, name, master, phase):
+        NodePath.__init__(self, name)
+        self.phase = phase
+        self.tier = NEAR
+        self.master = master
+        self.instance = master.instanceTo(self)
+
+    def setMaster(self, master, tier):
+        self.tier = tier
+        if master is self.master:
+            return
+        self.instance.detachNode()
+        self.master = master
+        self.instance = master.instanceTo(self)
+
+
+# AnimationSet Class
+# Hands out animated copies of one model. With shared-animation enabled all
+# copies play through a small set of phase offset master Actors, so the cost
+# of animating does not grow with the number of copies.
+class AnimationSet(object):
+    def __init__(self, model, anims=None, animation='Walk'):
+        self.model = model
+        self.anims = anims
+        self.animation = animation
+        self.shared = sharedAnimation.getValue()
+        self.phases = max(1, sharedAnimationPhases.getValue())
+
+        # full rate masters, one per phase
+        self.masters = []
+        # masters posed by hand at reducedAnimationRate, one per phase
+        self.reducedMasters = []
+        # single master that is never animated
+        self.frozenMaster = None
+        # simplified static geometry, if the model has any
+        self.lowModel = None
+        self.reducedTime = 0.0
+        self.reducedTimer = 0.0
+
+        if self.shared:
+            for phase in range(self.phases):
+                master = self.loadActor()
+                control = master.getAnimControl(self.animation)
+                # Start each master at an even spread through the walk cycle
+                control.pose(self.phaseFrame(control, phase))
+                control.loop(False)
+                self.masters.append(master)
+
+                self.reducedMasters.append(self.loadActor())
+
+            self.frozenMaster = self.loadActor()
+            self.frozenMaster.pose(self.animation, 0)
+            self.poseReduced()
+
+    def loadActor(self):
+        # Models and animations come precompiled from the asset cache
+        if self.anims:
+            anims = dict((name, modelPath(anim)) for name, anim in self.anims.items())
+            return Actor(modelPath(self.model), anims)
+        return Actor(modelPath(self.model))
+
+    def phaseFrame(self, control, phase):
+        return control.getNumFrames() * phase // self.phases
+
+    def loadLowDetail(self, loader):
+        # Simplified geometry is optional and lives next to the model as
+        # <model>-lod, without it the LOW tier falls back to the frozen pose
+        if not self.shared or self.lowModel is not None:
+            return
+        lowModel = loader.loadModel(modelPath(self.model + '-lod'), okMissing=True)
+        if lowModel:
+            lowModel.flattenStrong()
+            self.lowModel = lowModel
+        else:
+            self.lowModel = self.frozenMaster
+
+    def make(self, name, phase=0):
+        if not self.shared:
+            actor = self.loadActor()
+            # Set animation loop to Walk
+            actor.loop(self.animation)
+            return actor
+        phase %= len(self.masters)
+        return InstancedActor(name, self.masters[phase], phase)
+
+    def setTier(self, node, tier):
+        if not self.shared or node.tier == tier:
+            return
+        if tier == NEAR:
+            master = self.masters[node.phase]
+        elif tier == REDUCED:
+            master = self.reducedMasters[node.phase]
+        elif tier == LOW and self.lowModel is not None:
+            master = self.lowModel
+        else:
+            master = self.frozenMaster
+        node.setMaster(master, tier)
+
+    def update(self, dt):
+        # Step the reduced rate masters when their next update is due
+        if not self.shared:
+            return
+        self.reducedTime += dt
+        self.reducedTimer += dt
+        if self.reducedTimer >= 1.0 / reducedAnimationRate.getValue():
+            self.reducedTimer = 0.0
+            self.poseReduced()
+
+    def poseReduced(self):
+        for phase, master in enumerate(self.reducedMasters):
+            control = master.getAnimControl(self.animation)
+            frame = self.reducedTime * control.getFrameRate() + self.phaseFrame(control, phase)
+            control.pose(int(frame) % control.getNumFrames())
+
+    def release(self, node):
+        if isinstance(node, Actor):
+            node.cleanup()
+        node.removeNode()
+
+    def destroy(self):
+        for master in self.masters + self.reducedMasters + [self.frozenMaster]:
+            if master is not None:
+                master.cleanup()
+                master.removeNode()
+        if self.lowModel is not None and self.lowModel is not self.frozenMaster:
+            self.lowModel.removeNode()
+        self.masters = []
+        self.reducedMasters = []
+        self.frozenMaster = None
+        self.lowModel = None
@@ -0,0 +1,200 @@
+import hashlib
+import os
+import threading
+
+from panda3d.core import BamFile, BamWriter, ConfigVariableBool, ConfigVariableString, Filename, Loader, NodePath
+from panda3d.core import PandaSystem, SamplerState, TexturePool, VirtualFileSystem, getModelPath
+
+assetCache = ConfigVariableBool('asset-cache', True)
+assetCacheDir = ConfigVariableString('asset-cache-dir', 'cache')
+
+# model file extensions, in the order they are looked for
+modelExtensions = ['', '.bam', '.egg', '.egg.pz']
+
+# (source, flatten) -> (timestamp, digest), so a source is only hashed again
+# once it has changed
+hashCache = {}
+
+
+# Precompiled asset cache. Models are converted to .bam and textures to .txo
+# with mipmaps, cache entries are named after a hash of their source so that
+# editing a source invalidates its entry.
+def findSource(path, extensions=modelExtensions):
+    for extension in extensions:
+        filename = Filename(path + extension)
+        if VirtualFileSystem.getGlobalPtr().resolveFilename(filename, getModelPath().getValue()):
+            return filename
+    return None
+
+
+def contentHash(filename, flatten=False):
+    vfs = VirtualFileSystem.getGlobalPtr()
+    key = (filename.getFullpath(), flatten)
+    sourceFile = vfs.getFile(filename)
+    timestamp = sourceFile.getTimestamp() if sourceFile else None
+    cached = hashCache.get(key)
+    if cached and cached[0] == timestamp:
+        return cached[1]
+
+    digest = hashlib.md5(vfs.readFile(filename, True))
+    # bam files are only readable by matching Panda versions
+    digest.update(PandaSystem.getVersionString())
+    digest.update(str(flatten))
+    result = digest.hexdigest()[:16]
+    hashCache[key] = (timestamp, result)
+    return result
+
+
+def cachePath(path, digest, extension):
+    name = path.replace('/', '_').replace('\\', '_')
+    return os.path.abspath(os.path.join(assetCacheDir.getValue(), '%s-%s%s' % (name, digest, extension)))
+
+
+def tempPath(cached):
+    # Entries are written here and renamed into place, so that a crash or a
+    # concurrent reader never sees half a file under the final name. The
+    # extension is kept, Panda picks the file format by it.
+    root, extension = os.path.splitext(cached)
+    return '%s-tmp%d-%d%s' % (root, os.getpid(), threading.current_thread().ident, extension)
+
+
+def commitEntry(temp, cached):
+    # Returns False if the entry could not be put in place
+    try:
+        os.rename(temp, cached)
+    except OSError:
+        # someone else wrote it first (Windows will not rename over a file)
+        if os.path.exists(temp):
+            os.remove(temp)
+        return os.path.exists(cached)
+    return True
+
+
+def makeCacheDir():
+    try:
+        os.makedirs(assetCacheDir.getValue())
+    except OSError:
+        # already there, possibly made by another loader thread
+        pass
+
+
+def pandaPath(cached):
+    return Filename.fromOsSpecific(cached).getFullpath()
+
+
+def removeStale(path, keep):
+    # Drop older entries for the same source
+    directory = os.path.dirname(keep)
+    prefix = os.path.basename(cachePath(path, '', ''))
+    for entry in os.listdir(directory):
+        # other sources can share the prefix, eg. models_centipede-lod
+        if not entry.startswith(prefix) or '-' in entry[len(prefix):]:
+            continue
+        if entry != os.path.basename(keep):
+            try:
+                os.remove(os.path.join(directory, entry))
+            except OSError:
+                # already removed by another loader thread
+                pass
+
+
+def prepareTexture(texture):
+    texture.setMinfilter(SamplerState.FTLinearMipmapLinear)
+    texture.setMagfilter(SamplerState.FTLinear)
+    texture.generateRamMipmapImages()
+    # Compression needs a squish enabled build, keep it uncompressed otherwise
+    texture.compressRamImage()
+
+
+def modelPath(path, flatten=False):
+    # Return a path that loads the given model from the cache, building the
+    # cache entry if needed. Falls back to the original path on any problem.
+    if not assetCache.getValue():
+        return path
+    source = findSource(path)
+    if source is None or source.getExtension() == 'bam':
+        return path
+
+    digest = contentHash(source, flatten)
+    cached = cachePath(path, digest, '.bam')
+    if os.path.exists(cached):
+        return pandaPath(cached)
+
+    node = Loader.getGlobalPtr().loadSync(source)
+    if node is None:
+        return path
+    nodePath = NodePath(node)
+    if flatten:
+        nodePath.flattenStrong()
+    for texture in nodePath.findAllTextures():
+        prepareTexture(texture)
+
+    makeCacheDir()
+    temp = tempPath(cached)
+    bamFile = BamFile()
+    if not bamFile.openWrite(Filename.fromOsSpecific(temp)):
+        return path
+    # Store texture images in the bam so they upload without decoding
+    bamFile.getWriter().setFileTextureMode(BamWriter.BTMRawdata)
+    written = bamFile.writeObject(node)
+    bamFile.close()
+    if not written:
+        os.remove(temp)
+        return path
+    if not commitEntry(temp, cached):
+        return path
+    removeStale(path, cached)
+    return pandaPath(cached)
+
+
+def texturePath(path):
+    # Same as modelPath for a standalone texture, stored as .txo
+    if not assetCache.getValue():
+        return path
+    source = findSource(path, [''])
+    if source is None:
+        return path
+
+    digest = contentHash(source)
+    cached = cachePath(path, digest, '.txo')
+    if os.path.exists(cached):
+        return pandaPath(cached)
+
+    texture = TexturePool.loadTexture(source)
+    if texture is None:
+        return path
+    prepareTexture(texture)
+
+    makeCacheDir()
+    temp = tempPath(cached)
+    if not texture.write(Filename.fromOsSpecific(temp)):
+        if os.path.exists(temp):
+            os.remove(temp)
+        return path
+    if not commitEntry(temp, cached):
+        return path
+    removeStale(path, cached)
+    return pandaPath(cached)
+
+
+def loadTextureInBackground(showbase, path, callback):
+    # Resolve (converting on a cold cache) and read a texture on a thread,
+    # callback gets the texture from the task manager once it is loaded. The
+    # texture pool keeps it, so a later texturePath load of it is instant.
+    loaded = []
+
+    def load():
+        loaded.append(TexturePool.loadTexture(texturePath(path)))
+
+    thread = threading.Thread(target=load, name='Texture Loader')
+    thread.daemon = True
+    thread.start()
+
+    def waitForTexture(task):
+        if thread.isAlive():
+            return task.cont
+        if loaded and loaded[0]:
+            callback(loaded[0])
+        return task.done
+
+    showbase.taskMgr.add(waitForTexture, 'Load ' + path)
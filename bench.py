@@ -0,0 +1,160 @@
+import argparse
+import gc
+import hashlib
+import json
+import resource
+import sys
+import time
+from timeit import default_timer
+
+from panda3d.core import PandaSystem, loadPrcFileData
+
+# no window, no sound, and the tick profiler on whatever the config files say
+loadPrcFileData(
+    "",
+    """
+    window-type none
+    audio-library-name null
+    tick-profiler 1
+    log-level warning
+    """
+)
+
+from direct.showbase.ShowBase import ShowBase
+
+from game import Game
+from gamedata import GameData
+from userdata import UserData
+
+# heads further out than this turn back towards the middle of the arena
+wallMargin = 100.0
+
+
+# Headless simulation benchmark.
+# Usage: python bench.py [--players 1,2,4,8] [--segments 0,10,40] [--foods 32,128]
+#                        [--ticks 900] [--warmup 90] [--seed 1] [--output bench-results.jsonl]
+# Every combination is run from the same seed with scripted centipedes, so
+# results (and the final state checksum) are comparable between versions.
+class Bench(ShowBase):
+    def __init__(self, options):
+        ShowBase.__init__(self)
+        self.options = options
+        self.game = None
+
+    def makeGameData(self, foods):
+        gameData = GameData()
+        gameData.randSeed = self.options.seed
+        gameData.maxFoods = foods
+        # segments are added by the bench, the round must not end because of it
+        gameData.maxLength = sys.maxint
+        return gameData
+
+    def setup(self, players, segments, foods):
+        usersData = [UserData() for i in range(players)]
+        gameData = self.makeGameData(foods)
+        self.gameTick = 1.0 / gameData.tickRate
+        # A fresh scene for every combination: a reused one carries collider
+        # numbering and grown trail buffers over from the combinations run
+        # before it, which would make a run's checksum depend on the sweep
+        if self.game:
+            self.game.destroy()
+        self.game = Game(self, usersData, gameData)
+        for user in usersData:
+            for i in range(segments):
+                user.centipede.addLength()
+        return usersData
+
+    def steer(self, usersData):
+        # Head for the nearest food, or back to the middle near the walls
+        foods = self.game.foods
+        for user in usersData:
+            x, y = user.centipede.getHeadPos()
+            if abs(x) > wallMargin or abs(y) > wallMargin:
+                user.centipede.setDestination((0.0, 0.0))
+                continue
+            nearest = min(foods, key=lambda food: (food.x - x) ** 2 + (food.y - y) ** 2)
+            user.centipede.setDestination((nearest.x, nearest.y))
+
+    def run(self, players, segments, foods):
+        options = self.options
+        usersData = self.setup(players, segments, foods)
+        game = self.game
+        profiler = game.profiler
+
+        tick = 0
+        for tick in range(options.warmup):
+            if tick % options.steerInterval == 0:
+                self.steer(usersData)
+            game.runTick(self.gameTick, tick)
+
+        # allocations are counted as container objects left for the collector
+        gc.collect()
+        gc.disable()
+        profiler.resetRound()
+        started = default_timer()
+        for tick in range(options.warmup, options.warmup + options.ticks):
+            if tick % options.steerInterval == 0:
+                self.steer(usersData)
+            tickStarted = profiler.start('tick')
+            game.runTick(self.gameTick, tick)
+            profiler.tickDone(tickStarted)
+        elapsed = default_timer() - started
+        allocations = gc.get_count()[0]
+        garbage = gc.collect()
+        gc.enable()
+
+        summary = profiler.roundSummary()
+        snapshot = game.getSnapshot(tick + 1)
+        return {
+            'players': players,
+            'segments': segments,
+            'foods': foods,
+            'seed': options.seed,
+            'ticks': options.ticks,
+            'ticksPerSecond': options.ticks / elapsed if elapsed else 0.0,
+            'phases': summary['phases'],
+            'allocationsPerTick': float(allocations) / options.ticks,
+            'garbage': garbage,
+            'maxRssKb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'colliders': len(game.colliders),
+            'checksum': hashlib.md5(repr(snapshot)).hexdigest(),
+        }
+
+    def sweep(self):
+        options = self.options
+        with open(options.output, 'a') as results:
+            for players in options.players:
+                for segments in options.segments:
+                    for foods in options.foods:
+                        result = self.run(players, segments, foods)
+                        result['time'] = time.time()
+                        result['panda'] = PandaSystem.getVersionString()
+                        results.write(json.dumps(result, sort_keys=True) + '\n')
+                        results.flush()
+                        print '%3d players %4d segments %4d foods: %8.1f ticks/s  %6.1f allocs/tick  %s' % (
+                            players, segments, foods, result['ticksPerSecond'], result['allocationsPerTick'],
+                            result['checksum'][:8])
+        self.game.destroy()
+
+
+def counts(text):
+    return [int(value) for value in text.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the simulation headless over a sweep of match sizes')
+    parser.add_argument('--players', type=counts, default=[1, 2, 4, 8])
+    parser.add_argument('--segments', type=counts, default=[0, 10, 40])
+    parser.add_argument('--foods', type=counts, default=[32, 128])
+    parser.add_argument('--ticks', type=int, default=900)
+    parser.add_argument('--warmup', type=int, default=90)
+    parser.add_argument('--steer-interval', dest='steerInterval', type=int, default=10)
+    parser.add_argument('--seed', type=float, default=1.0)
+    parser.add_argument('--output', default='bench-results.jsonl')
+    options = parser.parse_args()
+
+    Bench(options).sweep()
+
+
+if __name__ == '__main__':
+    main()
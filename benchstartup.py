@@ -0,0 +1,94 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# Modules the client needs, roughly in the order it needs them
+clientModules = [
+    'panda3d.core',
+    'direct.showbase.ShowBase',
+    'direct.gui.DirectGui',
+    'start',
+    'lobby',
+    'round',
+    'game',
+    'centipede',
+    'food',
+    'animation',
+    'direct.actor.Actor',
+    'camerahandler',
+    'gamehandler',
+]
+
+importScript = """
+import sys, time
+started = time.time()
+import %s
+sys.stdout.write('%%f' %% (time.time() - started))
+"""
+
+# Runs main.py with the startup report turned on, quitting after one frame
+launchScript = """
+import sys
+from panda3d.core import loadPrcFileData
+loadPrcFileData('', 'startup-report-file %s\\nstartup-exit 1')
+sys.argv = ['main.py']
+import runpy
+runpy.run_path('main.py', run_name='__main__')
+"""
+
+
+# Client startup benchmark.
+# Usage: python benchstartup.py [--runs 5] [--output startup-results.jsonl]
+# Times the import of every client module on its own in a fresh interpreter,
+# and the time from launching the client to its first drawn frame.
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2] if values else 0.0
+
+
+def importTime(module):
+    return float(subprocess.check_output([sys.executable, '-c', importScript % module]))
+
+
+def firstFrameTime():
+    # Returns (seconds from process launch, seconds from main.py starting)
+    handle, report = tempfile.mkstemp(suffix='.jsonl')
+    os.close(handle)
+    try:
+        launched = time.time()
+        subprocess.call([sys.executable, '-c', launchScript % report.replace('\\', '/')])
+        with open(report) as reportFile:
+            result = json.loads(reportFile.readline())
+        return result['firstFrameAt'] - launched, result['firstFrame']
+    finally:
+        os.remove(report)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure client import times and time to first frame')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--output', default='startup-results.jsonl')
+    options = parser.parse_args()
+
+    imports = {}
+    for module in clientModules:
+        imports[module] = median([importTime(module) for run in range(options.runs)])
+        print '%-28s %7.1f ms' % (module, imports[module] * 1000)
+
+    frames = [firstFrameTime() for run in range(options.runs)]
+    firstFrame = median([frame[0] for frame in frames])
+    inProcess = median([frame[1] for frame in frames])
+    print '%-28s %7.1f ms (%.1f ms after main.py started)' % ('first frame', firstFrame * 1000, inProcess * 1000)
+
+    with open(options.output, 'a') as results:
+        results.write(json.dumps({'time': time.time(), 'runs': options.runs, 'imports': imports,
+                                  'firstFrame': firstFrame, 'firstFrameInProcess': inProcess},
+                                 sort_keys=True) + '\n')
+
+
+if __name__ == '__main__':
+    main()
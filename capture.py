@@ -0,0 +1,85 @@
+import struct
+import time
+import zlib
+from timeit import default_timer
+
+from panda3d.core import ConfigVariableString
+
+import rencode
+
+# file to record every sent and received datagram to, empty disables capture
+netCaptureFile = ConfigVariableString('net-capture-file', '')
+
+MAGIC = 'CCAP1'
+
+INCOMING = 0
+OUTGOING = 1
+
+# timestamp, direction, connection id, raw size, wire size, codec seconds,
+# payload length; followed by the payload as it went over the wire
+recordFormat = struct.Struct('!dBHIIfI')
+
+prefixLength = len(rencode.HEADER) + 1
+
+
+def encodeMeasured(data, compress):
+    # Encode like rencode.dumps but also return the uncompressed size
+    started = default_timer()
+    raw = rencode.dumps(data)
+    wire = raw
+    if compress:
+        wire = rencode.HEADER + 'Z' + zlib.compress(raw[prefixLength:])
+    return wire, len(raw), default_timer() - started
+
+
+def decodeMeasured(wire):
+    # Decode like rencode.loads but also return the uncompressed size
+    started = default_timer()
+    raw = wire
+    if wire[prefixLength - 1:prefixLength] == 'Z':
+        raw = rencode.HEADER + 'N' + zlib.decompress(wire[prefixLength:])
+    data = rencode.loads(raw)
+    return data, len(raw), default_timer() - started
+
+
+# CaptureWriter Class
+# Appends one fixed size header plus payload per datagram to a binary file.
+class CaptureWriter(object):
+    def __init__(self, filename):
+        self.file = open(filename, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+        self.connectionIds = {}
+
+    def connectionId(self, connection):
+        # Small stable ids for connections, keyed by remote address
+        if connection is None:
+            return 0
+        key = str(connection.getAddress())
+        connectionId = self.connectionIds.get(key)
+        if connectionId is None:
+            connectionId = self.connectionIds[key] = len(self.connectionIds) + 1
+        return connectionId
+
+    def record(self, direction, connection, rawSize, wire, codecTime):
+        self.file.write(recordFormat.pack(time.time(), direction, self.connectionId(connection), rawSize,
+                                          len(wire), codecTime, len(wire)))
+        self.file.write(wire)
+
+    def close(self):
+        self.file.close()
+
+
+def readCapture(filename):
+    # Yield (timestamp, direction, connection id, raw size, wire size, codec
+    # seconds, payload) for every record in a capture file
+    with open(filename, 'rb') as captureFile:
+        if captureFile.read(len(MAGIC)) != MAGIC:
+            raise ValueError('%s is not a capture file' % filename)
+        while True:
+            header = captureFile.read(recordFormat.size)
+            if len(header) < recordFormat.size:
+                return
+            fields = recordFormat.unpack(header)
+            payload = captureFile.read(fields[-1])
+            yield fields[:-1] + (payload,)
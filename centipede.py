@@ -1,158 +1,210 @@
-from direct.actor.Actor import Actor, BitMask32
-from direct.showbase.PythonUtil import fitDestAngle2Src
+import math
+
+from direct.actor.Actor import BitMask32
 from panda3d.core import Vec3
 
+from assets import modelPath
 from collision import initCollisionSphere
+from entities import HEAD, BODY, TAIL, makeEntityId
 
 
 # Centipede Class
+# Positions and headings live in the match wide Kinematics arrays, the Actors
+# are only synced from them. The body is a list of colliders, the simulation
+# never touches the scene graph; pool segments are taken and given back to
+# match it when the chain is synced.
 # TODO: Revisit parent class for this
 class Centipede(object):
-    def __init__(self, showbase, index, numPlayers, addToCollisions):
+    def __init__(self, parent, index, numPlayers, addToCollisions, addCollider, removeFromCollisions, kinematics,
+                 pool):
         self.addToCollisions = addToCollisions
-
-        # Load centipede model
-        self.head = Actor('models/centipede')
-        # Set animation loop to Walk
-        self.head.loop('Walk')
+        self.addCollider = addCollider
+        self.removeFromCollisions = removeFromCollisions
+        self.index = index
+        self.kinematics = kinematics
+        # body segments are borrowed from the match wide pool
+        self.pool = pool
+        self.animation = pool.animation
+
+        # Load centipede model, walking with every other centipede
+        self.head = self.animation.make('Head', index)
         # Reparent the model to render.
-        self.head.reparentTo(showbase.render)
+        self.head.reparentTo(parent)
 
         self.intoMask = BitMask32.bit(index + 1)
 
         self.h = 360.0 / numPlayers
         self.h *= index + 1
 
-        self.head.setH(self.h)
-
-        self.head.setPos(self.head, 0, -100, 0)
-
-        self.x = self.head.getX()
-        self.y = self.head.getY()
+        # Start 100 units behind the centre of the arena along our heading
+        self.x = math.sin(math.radians(self.h)) * 100
+        self.y = -math.cos(math.radians(self.h)) * 100
 
         # TODO: Instead of this use node positions to "join" the centipede together
         bounds = self.head.getTightBounds()
         self.length = (bounds[1] - bounds[0]).getX() * 0.5
+        self.kinematics.setSpacing(index, self.length)
 
         # TODO: Instead of sphere for collision use something better?
-        self.head.collisionNode = initCollisionSphere(self.head, 'Head', 0.65, self.intoMask, True)
+        self.head.collisionNode = initCollisionSphere(self.head, 'Head', 0.65, makeEntityId(HEAD, index),
+                                                      self.intoMask, True, model='models/centipede')
 
         # Add head to collision detection
-        addToCollisions(self.head.collisionNode)
+        self.head.collider = addToCollisions(self.head.collisionNode, self)
 
         self.body = []
+        # pool segments drawing the body, as of the last sync
+        self.bodyNodes = []
+        self.ringNode = None
 
-        # Load centipede model
-        self.tail = Actor('models/centipede')
-        # Set animation loop to Walk
-        self.tail.loop('Walk')
+        # Load centipede model, walking with every other centipede
+        self.tail = self.animation.make('Tail', index + 1)
         # Reparent the model to render.
-        self.tail.reparentTo(showbase.render)
+        self.tail.reparentTo(parent)
 
-        self.tail.collisionNode = initCollisionSphere(self.tail, 'Tail', 0.65, self.intoMask)
+        self.tail.collisionNode = initCollisionSphere(self.tail, 'Tail', 0.65, makeEntityId(TAIL, index),
+                                                      self.intoMask, model='models/centipede')
 
         # Add tail to collision detection
-        addToCollisions(self.tail.collisionNode)
-
-        self.destinationNode = showbase.render.attachNewNode('Destination' + str(index))
+        self.tail.collider = addToCollisions(self.tail.collisionNode, self)
 
         self.reset()
 
     def destroy(self):
         self.reset()
-        self.head.detachNode()
-        self.tail.detachNode()
+        self.syncBody(0)
+        self.detachRing()
+        self.removeFromCollisions(self.head.collider)
+        self.removeFromCollisions(self.tail.collider)
+        self.animation.release(self.head)
+        self.animation.release(self.tail)
 
     def reset(self):
-        for node in self.body:
-            node.detachNode()
+        for collider in self.body:
+            self.removeFromCollisions(collider)
         self.body = []
-        # Set position of centipede head
-        self.head.setX(self.x)
-        self.head.setY(self.y)
-        # Set rotation of centipede head
-        self.head.setH(self.h)
-
-        self.tail.setH(self.h)
-        # Set tail position
-        self.tail.setPos(self.head, 0, -self.length, 0)
-
-        self.destinationNode.setPos(self.head, 0, 1, 0)
-
-    def update(self, dt):
-        self.updateRotation(dt)
-        self.moveForwards(dt, 1.0)
-
-    def updateRotation(self, dt):
-        oldH = self.head.getH()
-        self.head.headsUp(self.destinationNode)
-        newH = self.head.getH()
-        self.head.setH(oldH)
-        newH = fitDestAngle2Src(oldH, newH)
-        if newH - oldH < 0.0:
-            change = -dt * 90.0
-        else:
-            change = dt * 90.0
-        if abs(newH - oldH) < abs(change):
-            self.head.setH(newH)
-            self.destinationNode.setPos(self.head, 0, 1, 0)
-        else:
-            self.head.setH(self.head.getH() + change)
-
-    def moveForwards(self, dt, multi):
-        # Update centipede position
-        self.head.setPos(self.head, 0, dt * multi * 25, 0)
-
-        for i in range(len(self.body)):
-            # Calculate new heading angle for body part
-            # And update body position
-            if i == 0:
-                self.body[i].headsUp(self.head)
-                self.body[i].setPos(self.body[i], 0, self.body[i].getDistance(self.head) - self.length, 0)
-            else:
-                self.body[i].headsUp(self.body[i - 1])
-                self.body[i].setPos(self.body[i], 0, self.body[i].getDistance(self.body[i - 1]) - self.length, 0)
-        if len(self.body) > 0:
-            # Update Tail Heading
-            self.tail.headsUp(self.body[len(self.body) - 1])
-            # Update body position
-            self.tail.setPos(self.tail, 0, self.body[len(self.body) - 1].getDistance(self.tail) - self.length, 0)
-        else:
-            # Update Tail Heading
-            self.tail.headsUp(self.head)
-            # Update body position
-            self.tail.setPos(self.tail, 0, self.head.getDistance(self.tail) - self.length, 0)
-
-    def addLength(self, showbase):
-        # Load centipede model
-        node = Actor('models/centipede')
-        # Set animation loop to Walk
-        node.loop('Walk')
-        # Reparent the model to render.
-        node.reparentTo(showbase.render)
-        # Set body rotation
-        node.setH(self.tail.getH())
-        # Set body position
-        node.setPos(self.tail.getPos())
-
-        node.collisionNode = initCollisionSphere(node, 'Body-' + str(len(self.body)), 0.65, self.intoMask)
-
-        self.addToCollisions(node.collisionNode)
+        self.kinematics.reset(self.index, self.x, self.y, self.h)
+        self.placeColliders()
+
+    def chain(self):
+        # Nodes of the centipede in kinematics column order, as last synced
+        return [self.head] + self.bodyNodes + [self.tail]
+
+    def colliders(self):
+        # Colliders of the centipede in kinematics column order
+        return [self.head.collider] + self.body + [self.tail.collider]
+
+    def placeColliders(self):
+        k = self.kinematics
+        row = self.index
+        for column, collider in enumerate(self.colliders()):
+            collider.place(k.x[row, column], k.y[row, column], k.h[row, column])
+
+    def syncBody(self, count):
+        # Take or give back pool segments until count of them are drawn
+        while len(self.bodyNodes) < count:
+            self.bodyNodes.append(self.pool.acquire())
+        while len(self.bodyNodes) > count:
+            self.pool.release(self.bodyNodes.pop())
+
+    def sync(self, positions, count):
+        # Copy the chain, as blended by RenderState.blend, onto the scene
+        # graph. count is the number of body segments it was captured with.
+        self.syncBody(count)
+        x, y, h = positions
+        row = self.index
+        self.head.setPosHpr(x[row, 0], y[row, 0], 0, h[row, 0], 0, 0)
+        for i, node in enumerate(self.bodyNodes):
+            node.setPosHpr(x[row, i + 1], y[row, i + 1], 0, h[row, i + 1], 0, 0)
+        tail = count + 1
+        self.tail.setPosHpr(x[row, tail], y[row, tail], 0, h[row, tail], 0, 0)
+
+    def getHeadPos(self):
+        return self.kinematics.x[self.index, 0], self.kinematics.y[self.index, 0]
+
+    def addLength(self):
+        segment = len(self.body)
+        # Only the collider is made here, a pool segment is taken to draw it
+        # at the next sync
+        collider = self.addCollider('Body-' + str(segment), makeEntityId(BODY, self.index, segment),
+                                    self.pool.shape, self)
 
         # Insert into body list
-        self.body.append(node)
-        # Set tail position
-        self.tail.setPos(node, 0, -0.5, 0)
+        self.body.append(collider)
+        # The new segment takes the tails place and the tail moves behind it
+        self.kinematics.addSegment(self.index)
+        self.placeColliders()
+
+    def removeLength(self):
+        # Drop the last body segment, its pool segment goes back at the next sync
+        self.removeFromCollisions(self.body.pop())
+        self.kinematics.removeSegment(self.index)
+        self.placeColliders()
 
     # for client to attach ring below clients head
     def attachRing(self, showbase):
-        self.ringNode = showbase.loader.loadModel('models/ring')
-        self.ringNode.setPos(-Vec3(0, 0, 1.25))
+        if self.ringNode is None:
+            self.ringNode = showbase.loader.loadModel(modelPath('models/ring'))
+            self.ringNode.setPos(-Vec3(0, 0, 1.25))
         self.ringNode.reparentTo(self.head)
 
+    def detachRing(self):
+        if self.ringNode is not None:
+            self.ringNode.removeNode()
+            self.ringNode = None
+
     def setDestination(self, destination):
         self.destination = Vec3(destination[0], destination[1], 0)
-        self.destinationNode.setPos(self.destination)
+        self.kinematics.setDestination(self.index, destination[0], destination[1])
 
     def getDestinationUpdate(self):
         return self.destination.getX(), self.destination.getY()
+
+    def getStateUpdate(self):
+        # Coarse authoritative state, for observers outside our interest radius
+        k = self.kinematics
+        row = self.index
+        return (float(k.x[row, 0]), float(k.y[row, 0]), float(k.h[row, 0]),
+                float(k.destX[row]), float(k.destY[row]), len(self.body))
+
+    def applyStateUpdate(self, state):
+        x, y, h, destX, destY, length = state
+        self.kinematics.setHead(self.index, x, y, h)
+        self.destination = Vec3(destX, destY, 0)
+        self.kinematics.setDestination(self.index, destX, destY)
+        while len(self.body) < length:
+            self.addLength()
+        while len(self.body) > length:
+            self.removeLength()
+
+    def getSnapshot(self):
+        # Head and trail, the rest of the chain is placed from them
+        k = self.kinematics
+        row = self.index
+        trailS, trailX, trailY = k.getTrail(row)
+        return (len(self.body), float(k.x[row, 0]), float(k.y[row, 0]), float(k.h[row, 0]),
+                float(k.destX[row]), float(k.destY[row]),
+                tuple(trailS.tolist()), tuple(trailX.tolist()), tuple(trailY.tolist()))
+
+    def applyCorrection(self, state):
+        # A snapshot sent to put a drifted copy right, one that already
+        # matches is left alone rather than snapped
+        if self.getSnapshot() != tuple(state):
+            self.applySnapshot(state)
+
+    def applySnapshot(self, state):
+        length, x, y, h, destX, destY, trailS, trailX, trailY = state
+        while len(self.body) < length:
+            self.addLength()
+        while len(self.body) > length:
+            self.removeLength()
+        k = self.kinematics
+        row = self.index
+        k.x[row, 0] = x
+        k.y[row, 0] = y
+        k.h[row, 0] = h
+        k.setTrail(row, trailS, trailX, trailY)
+        self.destination = Vec3(destX, destY, 0)
+        k.setDestination(row, destX, destY)
+        k.snap(row)
+        self.placeColliders()
@@ -9,6 +9,8 @@ from panda3d.core import QueuedConnectionManager
 from panda3d.core import QueuedConnectionReader
 
 import rencode
+from capture import CaptureWriter, INCOMING, OUTGOING, decodeMeasured, encodeMeasured, netCaptureFile
+from netio import DecodePipeline, netDecodeThreads, netIoThreads
 
 
 class Client(DirectObject):
@@ -25,18 +27,38 @@ class Client(DirectObject):
         self.compress = compress
 
         self.cManager = QueuedConnectionManager()
-        self.cReader = QueuedConnectionReader(self.cManager, 0)
-        self.cWriter = ConnectionWriter(self.cManager, 0)
+        ioThreads = netIoThreads.getValue()
+        self.cReader = QueuedConnectionReader(self.cManager, ioThreads)
+        self.cWriter = ConnectionWriter(self.cManager, ioThreads)
 
         # By default, we are not connected
         self.connected = False
 
         self.passedData = []
 
+        # optional record of all traffic for offline analysis
+        self.capture = None
+        if netCaptureFile.getValue():
+            self.capture = CaptureWriter(netCaptureFile.getValue())
+
+        # with I/O threads, messages are also decoded off the main loop
+        self.pipeline = None
+        if ioThreads:
+            self.pipeline = DecodePipeline(self.cReader, netDecodeThreads.getValue(), self.capture is not None)
+
         self.connect(self.host, self.port, self.timeout)
 
     def cleanup(self):
         self.removeAllTasks()
+        if self.pipeline:
+            self.pipeline.destroy()
+
+    def close(self):
+        self.cleanup()
+        if self.myConnection:
+            self.cReader.removeConnection(self.myConnection)
+            self.cManager.closeConnection(self.myConnection)
+        self.connected = False
 
     def startPolling(self):
         self.doMethodLater(0.1, self.tskDisconnectPolling, "clientDisconnectTask")
@@ -65,7 +87,9 @@ class Client(DirectObject):
         # TODO: Hacky sending nothing to force disconnect triggers
         #self.sendData()
         # Also checking for dataAvailable on reader will trigger the connection disconnected
-        self.cReader.dataAvailable()
+        # (the pipeline's reader pump already does this)
+        if not self.pipeline:
+            self.cReader.dataAvailable()
         # TODO: Confirm this works for client side (to both game server and master server)
         while self.cManager.resetConnectionAvailable():
             connPointer = PointerToConnection()
@@ -86,6 +110,11 @@ class Client(DirectObject):
 
     def processData(self, netDatagram):
         myIterator = PyDatagramIterator(netDatagram)
+        if self.capture:
+            wire = myIterator.getString()
+            data, rawSize, codecTime = decodeMeasured(wire)
+            self.capture.record(INCOMING, netDatagram.getConnection(), rawSize, wire, codecTime)
+            return data
         return self.decode(myIterator.getString())
 
     def encode(self, data, compress=False):
@@ -98,7 +127,12 @@ class Client(DirectObject):
 
     def sendData(self, data=None):
         myPyDatagram = PyDatagram()
-        myPyDatagram.addString(self.encode(data, self.compress))
+        if self.capture:
+            wire, rawSize, codecTime = encodeMeasured(data, self.compress)
+            self.capture.record(OUTGOING, self.myConnection, rawSize, wire, codecTime)
+            myPyDatagram.addString(wire)
+        else:
+            myPyDatagram.addString(self.encode(data, self.compress))
         self.cWriter.send(myPyDatagram, self.myConnection)
 
     def passData(self, data):
@@ -107,6 +141,12 @@ class Client(DirectObject):
     def getData(self):
         data = self.passedData
         self.passedData = []
+        if self.pipeline:
+            for connection, package, rawSize, wire, codecTime in self.pipeline.getData():
+                if self.capture:
+                    self.capture.record(INCOMING, connection, rawSize, wire, codecTime)
+                data.append(package)
+            return data
         while self.cReader.dataAvailable():
             datagram = NetDatagram()
             if self.cReader.getData(datagram):
@@ -1,12 +1,29 @@
+import math
+
 from panda3d.core import CollisionSphere, CollisionNode
 from direct.actor.Actor import BitMask32
 
 
-def initCollisionSphere(obj, desc, radiusMultiplier, intoMask=BitMask32(0x1), isFromCollider=False):
-    # Get the size of the object for the collision sphere.
+# Bounding sphere centre and radius of each model path, so that every copy of
+# a model does not have to compute its bounds again
+boundsCache = {}
+
+
+def getModelBounds(obj, model=None):
+    if model in boundsCache:
+        return boundsCache[model]
     bounds = obj.getChild(0).getBounds()
-    center = bounds.getCenter()
-    radius = bounds.getRadius() * radiusMultiplier
+    result = bounds.getCenter(), bounds.getRadius()
+    if model is not None:
+        boundsCache[model] = result
+    return result
+
+
+def initCollisionSphere(obj, desc, radiusMultiplier, entityId, intoMask=BitMask32(0x1), isFromCollider=False,
+                        model=None):
+    # Get the size of the object for the collision sphere.
+    center, radius = getModelBounds(obj, model)
+    radius *= radiusMultiplier
 
     # Create a collision sphere and name it something understandable.
     collSphereStr = desc
@@ -17,9 +34,85 @@ def initCollisionSphere(obj, desc, radiusMultiplier, intoMask=BitMask32(0x1), is
     cNode.setIntoCollideMask(intoMask)
 
     cNodepath = obj.attachNewNode(cNode)
+    # Tag the node with the entity it belongs to
+    cNodepath.setPythonTag('entity', entityId)
     # if show:
     #cNodepath.show()
 
     # Return a tuple with the collision node and its corrsponding string so
     # that the bitmask can be set.
     return cNodepath, collSphereStr
+
+
+def getColliderShape(nodePath):
+    # Sphere centre offset and radius of a collision node, scaled as it is
+    # drawn, and whether it collides into others
+    node = nodePath.node()
+    solid = node.getSolid(0)
+    scale = nodePath.getNetTransform().getScale()
+    centre = solid.getCenter()
+    return (centre.getX() * scale.getX(), centre.getY() * scale.getY(), centre.getZ() * scale.getZ(),
+            solid.getRadius() * scale.getX(), not node.getFromCollideMask().isZero())
+
+
+# Collider Class
+# Caches the world space sphere of a collision node so that it can be tested
+# without touching the scene graph. The owner places it every tick.
+class Collider(object):
+    def __init__(self, name, entityId, shape, order, nodePath=None):
+        # the collision node is only kept to be drawn, body segments share
+        # one shape and have none
+        self.nodePath = nodePath
+        self.name = name
+        self.entityId = entityId
+        # registration order, used to keep collision handling deterministic
+        self.order = order
+        self.cx, self.cy, self.cz, self.radius, self.isFrom = shape
+
+        self.x = 0.0
+        self.y = 0.0
+        self.ownerX = 0.0
+        self.ownerY = 0.0
+        self.h = 0.0
+
+    def place(self, x, y, h):
+        self.ownerX = x
+        self.ownerY = y
+        self.h = h
+        # Rotate the sphere centre offset by the owners heading
+        radians = math.radians(h)
+        cos = math.cos(radians)
+        sin = math.sin(radians)
+        self.x = x + self.cx * cos - self.cy * sin
+        self.y = y + self.cx * sin + self.cy * cos
+
+    def intersects(self, other):
+        dx = self.x - other.x
+        dy = self.y - other.y
+        dz = self.cz - other.cz
+        distance = self.radius + other.radius
+        return dx * dx + dy * dy + dz * dz < distance * distance
+
+
+# CollisionQueue Class
+# Collects the contacts found during a tick so they can be handled together,
+# in a fixed order, once the tick's collision detection is finished
+class CollisionQueue(object):
+    def __init__(self):
+        self.entries = []
+
+    def addEntry(self, fromCollider, intoCollider):
+        self.entries.append((fromCollider, intoCollider))
+
+    def sortEntries(self):
+        # Registration order is identical on every peer, memory order is not
+        self.entries.sort(key=lambda entry: (entry[0].order, entry[1].order))
+
+    def getNumEntries(self):
+        return len(self.entries)
+
+    def getEntry(self, index):
+        return self.entries[index]
+
+    def clearEntries(self):
+        self.entries = []
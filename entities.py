@@ -0,0 +1,33 @@
+# Entity kinds that own collision nodes
+HEAD = 0
+BODY = 1
+TAIL = 2
+FOOD = 3
+
+
+# Pack kind, owner and segment index into a single int so that a collision
+# node can be resolved to its entity with one dictionary lookup
+def makeEntityId(kind, owner, index=0):
+    return (kind << 24) | (owner << 16) | index
+
+
+def splitEntityId(entityId):
+    return entityId >> 24, (entityId >> 16) & 0xff, entityId & 0xffff
+
+
+# EntityRegistry Class
+class EntityRegistry(object):
+    def __init__(self):
+        self.entities = {}
+
+    def register(self, entityId, entity):
+        self.entities[entityId] = entity
+
+    def unregister(self, entityId):
+        self.entities.pop(entityId, None)
+
+    def lookup(self, entityId):
+        return self.entities.get(entityId)
+
+    def clear(self):
+        self.entities = {}
@@ -1,43 +1,88 @@
+import math
 import random
 
-from direct.actor.Actor import Actor
-
 from collision import initCollisionSphere
+from entities import FOOD, makeEntityId
+from log import getLogger
+
+log = getLogger('food')
+
+# size of the panda model, it walks 0.1 of its own units a second
+foodScale = 0.005
+foodSpeed = 0.1 * foodScale
 
 
 class Food(object):
-    def __init__(self, showbase, num, addToCollisions):
+    def __init__(self, parent, num, addToCollisions, animation):
         self.addToCollisions = addToCollisions
         self.num = num
+        self.animation = animation
 
-        # Load food model
-        self.model = Actor('panda-model',
-                           {'Walk': 'models/panda-walk4'})
+        # Load food model, walking with every other food
+        self.model = animation.make('Food-' + str(num), num)
         # Set Scale of food
-        self.model.setScale(0.005, 0.005, 0.005)
-        # Set animation loop to Walk
-        self.model.loop('Walk')
+        self.model.setScale(foodScale, foodScale, foodScale)
         # Reparent the model to render.
-        self.model.reparentTo(showbase.render)
+        self.model.reparentTo(parent)
 
-        self.model.collisionNode = initCollisionSphere(self.model, 'Food-' + str(num), 0.6)
+        # round seed and number of resets, see reset
+        self.seed = 0
+        self.resets = 0
 
-        # Add head to collision detection
-        self.addToCollisions(self.model.collisionNode)
+        self.model.collisionNode = initCollisionSphere(self.model, 'Food-' + str(num), 0.6, makeEntityId(FOOD, 0, num))
+
+        # Add food to collision detection
+        self.collider = self.addToCollisions(self.model.collisionNode, self)
 
         self.reset()
 
     def destroy(self):
-        self.model.detachNode()
+        self.animation.release(self.model)
 
     def update(self, dt):
-        self.model.setPos(self.model, 0, 0.1 * dt, 0)
+        self.prevX, self.prevY = self.x, self.y
+        # Walk forwards along current heading
+        radians = math.radians(self.h)
+        self.x -= math.sin(radians) * foodSpeed * dt
+        self.y += math.cos(radians) * foodSpeed * dt
+        self.collider.place(self.x, self.y, self.h)
+
+    def getRenderState(self):
+        return self.prevX, self.prevY, self.x, self.y, self.h
+
+    def sync(self, state, alpha=1.0):
+        prevX, prevY, x, y, h = state
+        x = prevX + (x - prevX) * alpha
+        y = prevY + (y - prevY) * alpha
+        self.model.setPosHpr(x, y, 0, h, 0, 0)
+
+    def getSnapshot(self):
+        return self.x, self.y, self.h, self.resets
+
+    def applySnapshot(self, state):
+        self.x, self.y, self.h, self.resets = state
+        self.prevX, self.prevY = self.x, self.y
+        self.collider.place(self.x, self.y, self.h)
+
+    def startRound(self, seed):
+        self.seed = seed
+        self.resets = 0
+        self.reset()
 
     def reset(self):
-        # Set position of centipede head
-        self.model.setX(random.random() * 250 - 125)
-        self.model.setY(random.random() * 250 - 125)
-        # Set rotation of centipede head
-        self.model.setH(random.random() * 360)
+        # Every food draws from a stream of its own, seeded by the round, its
+        # number and how often it has been reset. A food eaten on only one
+        # peer (by a centipede that peer has drifted on) cannot move any
+        # other food, and the food itself is put right by its snapshot.
+        stream = random.Random((self.seed * 1000003 + self.num) * 1000003 + self.resets)
+        self.resets += 1
+        # Set position of food
+        self.x = stream.random() * 250 - 125
+        self.y = stream.random() * 250 - 125
+        # Set rotation of food
+        self.h = stream.random() * 360
+        # a new food appears in place rather than sliding there
+        self.prevX, self.prevY = self.x, self.y
+        self.collider.place(self.x, self.y, self.h)
 
-        print self.model.getX(), self.model.getY(), self.model.getH()
+        log.debug("food %d reset to %.2f %.2f %.2f", self.num, self.x, self.y, self.h)
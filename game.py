@@ -1,150 +1,388 @@
-import random
-
 from direct.showbase.DirectObject import DirectObject
-from panda3d.core import AmbientLight
-from panda3d.core import CollisionTraverser, CollisionHandlerEvent
+from panda3d.core import AmbientLight, ConfigVariableBool, NodePath
 from panda3d.core import LVector3
 from panda3d.core import PointLight
 
+from animation import AnimationSet
 from centipede import Centipede
+from collision import Collider, CollisionQueue, getColliderShape
+from entities import BODY, FOOD, TAIL, EntityRegistry, splitEntityId
 from food import Food
+from kinematics import Kinematics
+from log import getLogger
+from profiler import getProfiler
+from segmentpool import SegmentPool
+from simthread import RenderState
+from spatialhash import SpatialHash
+from stats import PlayerStats
 from world import World
 
+log = getLogger('game')
+
+# draw the collision spheres, they are not part of the scene otherwise
+showCollisions = ConfigVariableBool('show-collisions', False)
 
+# Game Class
+# The match scene (arena, lights, actors and collision nodes) is built once
+# and reset in place at the start of every round.
 class Game(DirectObject):
     def __init__(self, showbase, usersData, gameData):
         DirectObject.__init__(self)
 
         self.showbase = showbase
-        self.usersData = usersData
+        self.usersData = []
         self.gameData = gameData
+        self.profiler = getProfiler()
 
-        random.seed(self.gameData.randSeed)
-
-        # Initialize the collision traverser.
-        self.cTrav = CollisionTraverser()
+        # everything in the match hangs off here so it can be hidden in the lobby
+        self.root = showbase.render.attachNewNode('Game')
 
-        # Initialize the handler.
-        self.collHandEvent = CollisionHandlerEvent()
-        self.collHandEvent.addInPattern('into-%in')
+        # Broadphase over the arena, heads are only tested against colliders
+        # in neighbouring cells
+        self.broadphase = SpatialHash(8.0, 125.0)
+        self.colliders = []
+        self.colliderCount = 0
+        # pairs that were touching last tick, collisions fire on first contact
+        self.contacts = set()
+        # new contacts of the current tick, handled in one sorted batch
+        self.collisionQueue = CollisionQueue()
+        # collision solids live here, away from the actors and the arena
+        self.collisionRoot = NodePath('Collision Root')
+        if showCollisions.getValue():
+            self.collisionRoot.reparentTo(self.root)
+            self.collisionRoot.show()
+        # resolves the entity id tagged on each collision node
+        self.entities = EntityRegistry()
 
-        self.world = World(showbase)
+        self.world = World(showbase, self.root)
 
-        self.ambientLight = showbase.render.attachNewNode(AmbientLight("ambientLight"))
+        self.ambientLight = self.root.attachNewNode(AmbientLight("ambientLight"))
         # Set the color of the ambient light
         self.ambientLight.node().setColor((.1, .1, .1, 1))
         # add the newly created light to the lightAttrib
         # showbase.render.setLight(self.ambientLight)
 
-        self.spotlight = None
+        self.spotlight = self.root.attachNewNode(PointLight("playerSpotlight"))
+        self.spotlight.setPos(LVector3(0, 0, 8))
+        # Now we create a spotlight. Spotlights light objects in a given cone
+        # They are good for simulating things like flashlights
+        self.spotlight.node().setAttenuation(LVector3(.025, 0.0005, 0.0001))
+        self.spotlight.node().setColor((0.35, 0.35, .35, 1))
+        self.spotlight.node().setSpecularColor((0.01, 0.01, 0.01, 1))
+
+        self.perPixelEnabled = True
+        self.shadowsEnabled = True
+        #if self.spotlight:
+        #    self.spotlight.node().setShadowCaster(True, 512, 512)
+        showbase.render.setShaderAuto()
+
+        # Animations shared by every copy of the centipede and food models
+        self.centipedeAnimation = AnimationSet('models/centipede')
+        self.foodAnimation = AnimationSet('panda-model', {'Walk': 'models/panda-walk4'})
+        # Body segments for every centipede, preloaded before the first round
+        self.segmentPool = SegmentPool(self.root, self.centipedeAnimation, len(usersData) * 8,
+                                       showSpheres=showCollisions.getValue())
+        # the live simulation, as syncNodes draws it when given nothing else
+        self.renderState = RenderState()
+
+        self.kinematics = None
+        self.centipedes = []
+        self.centipede = None
+        self.foods = []
+
+        self.startRound(usersData, gameData)
+
+    def startRound(self, usersData, gameData):
+        # Reuse the scene for a new round, only rebuilding the centipedes when
+        # the number of players has changed
+        self.usersData = usersData
+        self.gameData = gameData
+
+        # keep the spotlight safe from any centipede that gets rebuilt
+        self.spotlight.reparentTo(self.root)
 
         numberOfPlayers = len(self.usersData)
+        if len(self.centipedes) != numberOfPlayers:
+            self.destroyCentipedes()
+            # Simulation state of every centipede in the match
+            self.kinematics = Kinematics(numberOfPlayers)
+            for index in range(numberOfPlayers):
+                self.centipedes.append(Centipede(self.root, index, numberOfPlayers, self.addToCollisions,
+                                                 self.addCollider, self.removeFromCollisions, self.kinematics,
+                                                 self.segmentPool))
+
+        self.centipede = None
         for index, user in enumerate(self.usersData):
-            user.centipede = Centipede(showbase, index, numberOfPlayers, self.addToCollisions)
+            user.centipede = self.centipedes[index]
+            user.centipede.reset()
+            user.centipede.detachRing()
             if user.thisPlayer:
                 self.centipede = user.centipede
-                self.centipede.attachRing(showbase)
+                self.centipede.attachRing(self.showbase)
 
-                self.spotlight = self.centipede.head.attachNewNode(PointLight("playerSpotlight"))
-                self.spotlight.setPos(LVector3(0, 0, 8))
-                # Now we create a spotlight. Spotlights light objects in a given cone
-                # They are good for simulating things like flashlights
-                self.spotlight.node().setAttenuation(LVector3(.025, 0.0005, 0.0001))
-                self.spotlight.node().setColor((0.35, 0.35, .35, 1))
-                self.spotlight.node().setSpecularColor((0.01, 0.01, 0.01, 1))
+        # The spotlight follows the player, if there is one
+        if self.centipede:
+            self.spotlight.reparentTo(self.centipede.head)
+            self.showbase.render.setLight(self.spotlight)
+        else:
+            self.showbase.render.clearLight(self.spotlight)
 
-                showbase.render.setLight(self.spotlight)
+        while len(self.foods) > self.gameData.maxFoods:
+            self.removeFromCollisions(self.foods[-1].collider)
+            self.foods.pop().destroy()
+        while len(self.foods) < self.gameData.maxFoods:
+            self.foods.append(Food(self.root, len(self.foods), self.addToCollisions, self.foodAnimation))
+        # the seed travels as a double, which every peer turns into the same int
+        foodSeed = int(self.gameData.randSeed * 0xFFFFFFFF)
+        for food in self.foods:
+            food.startRound(foodSeed)
+        self.renumberColliders()
 
-        self.perPixelEnabled = True
-        self.shadowsEnabled = True
-        #if self.spotlight:
-        #    self.spotlight.node().setShadowCaster(True, 512, 512)
-        showbase.render.setShaderAuto()
+        self.contacts = set()
+        # what every player did this round, in centipede order
+        self.stats = [PlayerStats() for user in self.usersData]
+        self.syncNodes()
+        self.root.unstash()
 
-        self.foods = []
-        for i in range(self.gameData.maxFoods):
-            self.foods.append(Food(self.showbase, i, self.addToCollisions))
+    def renumberColliders(self):
+        # Collisions are handled in registration order, which has to be the
+        # same on every peer however its scene was built up over earlier
+        # rounds: heads and tails by centipede, then foods. Bodies are
+        # registered as they grow from here on.
+        self.colliderCount = 0
+        colliders = []
+        for centipede in self.centipedes:
+            colliders.extend(centipede.colliders())
+        colliders.extend(food.collider for food in self.foods)
+        for collider in colliders:
+            collider.order = self.colliderCount
+            self.colliderCount += 1
+        self.colliders.sort(key=lambda collider: collider.order)
+
+    def endRound(self):
+        # Keep everything loaded but out of the scene until the next round
+        self.showbase.render.clearLight(self.spotlight)
+        self.spotlight.reparentTo(self.root)
+        self.root.stash()
+
+    def destroyCentipedes(self):
+        for centipede in self.centipedes:
+            centipede.destroy()
+        self.centipedes = []
 
     def destroy(self):
         self.ignoreAll()
-        self.collHandEvent.clear()
-        self.ambientLight.removeNode()
-        if self.spotlight:
-            self.showbase.render.clearLight(self.spotlight)
-            self.spotlight.removeNode()
-        self.world.destroy()
-        for user in self.usersData:
-            user.centipede.destroy()
+        self.showbase.render.clearLight(self.spotlight)
+        self.spotlight.removeNode()
+        self.destroyCentipedes()
+        self.segmentPool.destroy()
         for food in self.foods:
             food.destroy()
+        self.foods = []
+        self.broadphase.clear()
+        self.entities.clear()
+        self.colliders = []
+        self.collisionRoot.removeNode()
+        self.centipedeAnimation.destroy()
+        self.foodAnimation.destroy()
+        self.world.destroy()
+        self.root.removeNode()
 
     def runTick(self, dt, tick):
-        # run each of the centipedes simulations
+        profiler = self.profiler
+        # run all of the centipedes simulations in one batched step
+        started = profiler.start('centipedes')
+        self.kinematics.step(dt)
+        for index in self.kinematics.outOfBounds(123):
+            self.usersData[index].centipede.reset()
+            self.stats[index].died()
+        profiler.stop('centipedes', started)
         for user in self.usersData:
-            user.centipede.update(dt)
-            headPosition = user.centipede.head.getPos()
-            if abs(headPosition.x) > 123 or abs(headPosition.y) > 123:
-                user.centipede.reset()
-            if len(user.centipede.body) > 10:
+            if len(user.centipede.body) > self.gameData.maxLength:
                 return False
 
+        started = profiler.start('foods')
         for food in self.foods:
             food.update(dt)
+        profiler.stop('foods', started)
 
-        self.cTrav.traverse(self.showbase.render)
+        self.detectCollisions()
 
         # Return true if game is still not over (false to end game)
         return True
 
-    def collideInto(self, collEntry):
-        print "collide into"
-        fromInto = collEntry.getFromNodePath().node().getIntoCollideMask()
-        intoInto = collEntry.getIntoNodePath().node().getIntoCollideMask()
-        fromIntoIndex = fromInto.getLowestOnBit() - 1
-        intoIntoIndex = intoInto.getLowestOnBit() - 1
+    def captureState(self, state):
+        # Copy what syncNodes draws into state, for drawing on another thread
+        state.fill(self.kinematics, self.foods)
+
+    def syncNodes(self, alpha=1.0, state=None):
+        # Copy simulation state onto the actors, only needed when rendering.
+        # alpha blends from the previous tick, for clients drawing between ticks.
+        # state is a copy from captureState, the live simulation otherwise.
+        if state is None:
+            state = self.renderState
+            state.fill(self.kinematics, self.foods, copy=False)
+        positions = state.blend(alpha)
+        for centipede in self.centipedes:
+            centipede.sync(positions, state.counts[centipede.index])
+        for food, foodState in zip(self.foods, state.foods):
+            food.sync(foodState, alpha)
+        if showCollisions.getValue():
+            # body segments carry their own sphere
+            for collider in self.colliders:
+                if collider.nodePath is not None:
+                    collider.nodePath.setPosHpr(collider.ownerX, collider.ownerY, 0, collider.h, 0, 0)
+
+    def getSnapshot(self, tick):
+        # Everything needed to carry the simulation on from tick on another
+        # peer
+        # collision handling order follows registration order, which differs
+        # for a peer that rebuilt the chains in one go
+        orders = tuple((collider.entityId, collider.order) for collider in self.colliders)
+        # pairs found before a reset in the same tick can name colliders that
+        # are gone since, they could not touch again anyway
+        registered = set(self.colliders)
+        contacts = tuple(sorted((a.entityId, b.entityId) for a, b in self.contacts
+                                if a in registered and b in registered))
+        return (tick, tuple(centipede.getSnapshot() for centipede in self.centipedes), self.getFoodStates(),
+                orders, self.colliderCount, contacts)
+
+    def applySnapshot(self, snapshot):
+        # Returns the tick the snapshot was taken at
+        tick, centipedes, foods, orders, colliderCount, contacts = snapshot
+
+        for centipede, state in zip(self.centipedes, centipedes):
+            centipede.applySnapshot(state)
+        self.applyFoodStates(foods)
+
+        colliders = dict((collider.entityId, collider) for collider in self.colliders)
+        for entityId, order in orders:
+            colliders[entityId].order = order
+        self.colliderCount = colliderCount
+        self.contacts = set((colliders[a], colliders[b]) for a, b in contacts)
+
+        self.syncNodes()
+        return tick
+
+    def getFoodStates(self):
+        return tuple(food.getSnapshot() for food in self.foods)
+
+    def applyFoodStates(self, states):
+        for food, state in zip(self.foods, states):
+            food.applySnapshot(state)
+
+    def detectCollisions(self):
+        started = self.profiler.start('broadphase')
+        for centipede in self.centipedes:
+            centipede.placeColliders()
+        for collider in self.colliders:
+            self.broadphase.move(collider, collider.x, collider.y)
+
+        contacts = set()
+        queue = self.collisionQueue
+        queue.clearEntries()
+        for collider in self.colliders:
+            if not collider.isFrom:
+                continue
+            for other in self.broadphase.query(collider.x, collider.y):
+                if other is collider or not collider.intersects(other):
+                    continue
+                pair = (collider, other)
+                contacts.add(pair)
+                if pair not in self.contacts:
+                    queue.addEntry(collider, other)
+        self.contacts = contacts
+        self.profiler.stop('broadphase', started)
+
+        started = self.profiler.start('collisions')
+        self.processCollisions()
+        self.profiler.stop('collisions', started)
+
+    def processCollisions(self):
+        queue = self.collisionQueue
+        queue.sortEntries()
+        # heads of centipedes reset by an earlier entry, their later contacts
+        # and the removed colliders of anyone reset are gone
+        reset = set()
+        for index in range(queue.getNumEntries()):
+            fromCollider, intoCollider = queue.getEntry(index)
+            if fromCollider.entityId in reset or intoCollider not in self.colliders:
+                continue
+            if self.collideInto(fromCollider.entityId, intoCollider.entityId):
+                reset.add(fromCollider.entityId)
+        queue.clearEntries()
+
+    def collideInto(self, fromId, intoId):
+        # Returns True if the crasher was reset
+        log.debug("collide into %d %d", fromId, intoId)
+        intoKind, intoOwner, intoIndex = splitEntityId(intoId)
+        crasher = self.entities.lookup(fromId)
 
         # Collision was with a Food!
-        if intoIntoIndex == -1:
-            # TODO: Get food better
-            for food in self.foods:
-                if collEntry.getIntoNodePath() == food.model.collisionNode[0]:
-                    user = self.usersData[fromIntoIndex]
-                    user.centipede.addLength(self.showbase)
-                    food.reset()
-                    print "om nommed a food"
-                    return
+        if intoKind == FOOD:
+            food = self.entities.lookup(intoId)
+            crasher.addLength()
+            self.stats[crasher.index].ate(len(crasher.body))
+            food.reset()
+            log.debug("om nommed a food")
+            return False
+
+        crashee = self.entities.lookup(intoId)
 
         # Centipede eating themself
-        if fromIntoIndex == intoIntoIndex:
-            print "hitting self"
-            user = self.usersData[fromIntoIndex]
-            if len(user.centipede.body) > 2:
-                if collEntry.getIntoNodePath() == user.centipede.tail.collisionNode[0]:
-                    user.centipede.reset()
-                    print "dieded self tail"
-                    return
-                for i in range(len(user.centipede.body) - 1 - 2):
-                    if collEntry.getIntoNodePath() == user.centipede.body[i + 2].collisionNode[0]:
-                        user.centipede.reset()
-                        print "dieded self body", i
-                        return
+        if crasher is crashee:
+            log.debug("hitting self")
+            if len(crasher.body) > 2:
+                if intoKind == TAIL:
+                    crasher.reset()
+                    self.stats[crasher.index].died()
+                    log.debug("dieded self tail")
+                    return True
+                elif intoKind == BODY and 2 <= intoIndex < len(crasher.body) - 1:
+                    crasher.reset()
+                    self.stats[crasher.index].died()
+                    log.debug("dieded self body %d", intoIndex - 2)
+                    return True
+            return False
         else:
             # TODO: Check for both heads
             # if bothHeads:
             # one will survive if it's angle to the other node is greater than 90degrees from straight ahead
 
             # Centipede eating another centipede
-            crasher = self.usersData[fromIntoIndex]
-            crasher.centipede.reset()
+            crasher.reset()
+            self.stats[crasher.index].died()
 
             # Give crashee a point on behalf of crasher
-            crashee = self.usersData[intoIntoIndex]
-            print "Player", intoIntoIndex, " gets a point!"
-            # crashee.point += 1
+            log.debug("Player %d gets a point!", intoOwner)
+            self.stats[intoOwner].killed()
+            return True
+
+    def addToCollisions(self, item, entity):
+        # Move the solid out of the actor into the collision root, keeping
+        # its scale, and track it in the broadphase
+        item[0].unstash()
+        item[0].wrtReparentTo(self.collisionRoot)
+        return self.addCollider(item[1], item[0].getPythonTag('entity'), getColliderShape(item[0]), entity, item[0])
+
+    def addCollider(self, name, entityId, shape, entity, nodePath=None):
+        # Track a collider in the broadphase, without touching the scene graph
+        collider = Collider(name, entityId, shape, self.colliderCount, nodePath)
+        self.colliderCount += 1
+        self.colliders.append(collider)
+        self.entities.register(collider.entityId, entity)
 
-    def addToCollisions(self, item):
-        # Add this object to the traverser.
-        self.cTrav.addCollider(item[0], self.collHandEvent)
+        # Neighbouring cells must be large enough to hold any touching pair
+        if collider.radius * 2 > self.broadphase.cellSize:
+            self.broadphase.resize(collider.radius * 2)
+        return collider
 
-        # Accept the events sent by the collisions.
-        self.accept('into-' + str(item[1]), self.collideInto)
+    def removeFromCollisions(self, collider):
+        # Only heads, tails and foods have a node here and they are only
+        # removed when destroyed, the node would otherwise stay behind under
+        # the collision root
+        if collider.nodePath is not None:
+            collider.nodePath.removeNode()
+        self.colliders.remove(collider)
+        self.broadphase.remove(collider)
+        self.entities.unregister(collider.entityId)
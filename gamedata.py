@@ -1,11 +1,19 @@
 from random import random
 
+from panda3d.core import ConfigVariableDouble
+
+# simulation ticks per second, the server's value is used by every client
+simRate = ConfigVariableDouble('sim-rate', 30.0)
+
 
 # TODO: Revisit parent class
 class GameData(object):
     def __init__(self, isServer=False):
         self.randSeed = 0.0
         self.maxFoods = 32
+        # the round is over once a centipede grows past this
+        self.maxLength = 10
+        self.tickRate = simRate.getValue()
 
         if isServer:
             self.randSeed = random()
@@ -13,9 +21,12 @@ class GameData(object):
     def packageData(self):
         data = []
         data.append(('seed', self.randSeed))
+        data.append(('tickRate', self.tickRate))
         return data
 
     def unpackageData(self, data):
         for package in data:
             if package[0] == 'seed':
                 self.randSeed = package[1]
+            elif package[0] == 'tickRate':
+                self.tickRate = package[1]
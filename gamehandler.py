@@ -1,6 +1,7 @@
 from direct.showbase.DirectObject import DirectObject
 
 from camerahandler import CameraHandler
+from lod import LodManager
 
 
 class GameHandler(DirectObject):
@@ -27,10 +28,15 @@ class GameHandler(DirectObject):
 
         self.ch = CameraHandler(showbase)
 
+        # animation and geometry level of detail, driven by the camera above
+        self.lod = LodManager(showbase, self.game)
+
         # sets the camera up behind clients warlock looking down on it from angle
-        follow = self.game.centipede.head
-        self.ch.setTarget(follow.getPos().getX(), follow.getPos().getY(), follow.getPos().getZ())
-        self.ch.turnCameraAroundPoint(follow.getH(), 0)
+        # (spectators have no centipede to follow)
+        if self.game.centipede:
+            follow = self.game.centipede.head
+            self.ch.setTarget(follow.getPos().getX(), follow.getPos().getY(), follow.getPos().getZ())
+            self.ch.turnCameraAroundPoint(follow.getH(), 0)
 
     def setValue(self, array, key, value):
         array[key] = value
@@ -46,13 +52,14 @@ class GameHandler(DirectObject):
         self.ch.camMoveTask(dt)
 
         # if c is down update camera to always be following on the warlock
-        if self.keys["c"]:
+        if self.keys["c"] and self.game.centipede:
             follow = self.game.centipede.head
             self.ch.setTarget(follow.getPos().getX(), follow.getPos().getY(), follow.getPos().getZ())
             self.ch.turnCameraAroundPoint(0, 0)
 
     def update(self, dt):
         self.updateCamera(dt)
+        self.lod.update(dt)
 
     def destroy(self):
         self.ignoreAll()
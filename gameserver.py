@@ -1,8 +1,22 @@
+import os
+import time
+
 from direct.showbase.ShowBase import ShowBase
+from panda3d.core import ConfigVariableBool, ConfigVariableDouble, ConfigVariableInt, ConfigVariableString
 from panda3d.core import loadPrcFileData
 
+from client import Client
 from game import Game
-from gamedata import GameData
+from gamedata import GameData, simRate
+from gccontrol import GcController
+from interest import InterestManager
+from log import getLogger
+from matchmaking import checkTicket, masterPort, masterSecret, masterServer
+from metrics import MetricsServer
+from persistence import getStatsStore
+from preload import Preloader
+from profiler import getProfiler
+from sendrate import SendQueue, pingInterval
 from server import Server
 from user import User
 from userdata import UserData
@@ -17,27 +31,84 @@ loadPrcFileData(
     """
 )
 
-gameTick = 1.0 / 30.0
+log = getLogger('server')
+
+gameTick = 1.0 / simRate.getValue()
+# longest time to wait for slow loaders before starting a round without them
+syncTimeout = 10.0
+
+# where players reach this server, as told to the master server
+serverHost = ConfigVariableString('server-host', 'localhost')
+serverPort = ConfigVariableInt('server-port', 9099)
+serverCapacity = ConfigVariableInt('server-capacity', 8)
+# only let in players the master server sent here
+requireTicket = ConfigVariableBool('require-ticket', False)
+masterReportInterval = ConfigVariableDouble('master-report-interval', 2.0)
 
 
 class GameServer(ShowBase):
     def __init__(self):
         ShowBase.__init__(self)
 
-        self.server = Server(9099, compress=True)
+        self.server = Server(serverPort.getValue(), compress=True)
+        if requireTicket.getValue() and not masterSecret.getValue():
+            log.warning('require-ticket is set without a master-secret, nobody will be let in')
         self.server.handleNewConnection = self.handleNewConnection
         self.server.handleLostConnection = self.handleLostConnection
+        self.address = '%s:%d' % (serverHost.getValue(), serverPort.getValue())
 
         self.tempConnections = []
         self.currentPlayers = []
+        self.game = None
+        # players of the running round in centipede order, anyone else in
+        # currentPlayers joined late and is watching
+        self.roundPlayers = []
+        self.inRound = False
+
+        # tick timings, served on localhost for scraping
+        self.profiler = getProfiler()
+        self.profiler.budget = gameTick
+        self.metricsServer = MetricsServer(self.profiler)
+        # the cyclic collector only runs between ticks during a round
+        self.gcController = GcController(self.profiler)
+        # match results, written behind on their own thread
+        self.statsStore = getStatsStore()
+
+        # have the round assets in the model pool before the first round
+        self.preloader = Preloader(self)
+
+        # register with the master server, if there is one, and keep it
+        # up to date with how busy we are
+        self.master = None
+        if masterServer.getValue():
+            self.master = Client(masterServer.getValue(), masterPort.getValue(), compress=True)
+            if self.master.connected:
+                self.master.sendData(('register', (serverHost.getValue(), serverPort.getValue(),
+                                                   serverCapacity.getValue())))
+                self.taskMgr.doMethodLater(masterReportInterval.getValue(), self.reportLoad, 'Report Load')
+            else:
+                log.warning('could not reach master server %s', masterServer.getValue())
+
+        self.taskMgr.add(self.lobbyLoop, 'Lobby Loop')
+
+    def reportLoad(self, task):
+        # the master only reads from us, but its replies still need draining
+        self.master.getData()
+        players = len([user for user in self.currentPlayers if user.connection]) + len(self.tempConnections)
+        self.master.sendData(('load', (players, self.inRound, self.profiler.overrunRate())))
+        return task.again
 
-        self.taskMgr.doMethodLater(0.5, self.lobbyLoop, 'Lobby Loop')
+    def broadcastData(self, data, exclude=None):
+        # Broadcast data out to all users, encoded once
+        connections = [user.connection for user in self.currentPlayers
+                       if user.connection and user is not exclude]
+        self.server.sendDataToAll(data, connections)
+        self.profiler.count('messages_sent', len(connections))
 
-    def broadcastData(self, data):
-        # Broadcast data out to all users
-        for user in self.currentPlayers:
-            if user.connection:
-                self.server.sendData(data, user.connection)
+    def rosterSnapshot(self):
+        # (name, ready) of every player in join order, which is also the
+        # order centipedes are handed out in
+        return tuple((user.name, user.ready) for user in self.currentPlayers)
 
     def getUsers(self):
         # return a list of all users
@@ -59,11 +130,11 @@ class GameServer(ShowBase):
         return data
 
     def handleNewConnection(self, connection):
-        print "handleNewConnection"
+        log.info("handleNewConnection")
         self.tempConnections.append(connection)
 
     def handleLostConnection(self, connection):
-        print "handleLostConnection"
+        log.info("handleLostConnection")
         # remove from our activeConnections list
         if connection in self.tempConnections:
             self.tempConnections.remove(connection)
@@ -77,23 +148,72 @@ class GameServer(ShowBase):
         package = datagram[1]
         if len(package) == 2:
             if package[0] == 'username':
-                print 'attempting to authenticate', package[1]
-                self.tempConnections.remove(connection)
-
-                user = User(package[1], connection)
-                # confirm authorization
-                self.server.sendData(('auth', user.name), user.connection)
-                self.updateClient(user)
-                self.currentPlayers.append(user)
-
-    def updateClient(self, user):
-        for existing in self.currentPlayers:
-            if existing.name != user.name:
-                self.server.sendData(('client', existing.name), user.connection)
-                self.server.sendData(('ready', (existing.name, existing.ready)), user.connection)
-                if existing.connection:
-                    self.server.sendData(('client', user.name), existing.connection)
-        self.server.sendData(('client', user.name), user.connection)
+                if requireTicket.getValue():
+                    log.info('%s has no ticket', package[1])
+                    self.tempConnections.remove(connection)
+                    self.server.sendData(('fail', package[1]), connection)
+                else:
+                    self.authenticate(connection, package[1])
+            elif package[0] == 'ticket':
+                # (name, ticket) or (name, ticket, resume token), the token only
+                # counts if the player is still in the round
+                name, ticket = package[1][:2]
+                token = package[1][2] if len(package[1]) > 2 else None
+                if checkTicket(name, self.address, ticket):
+                    self.authenticate(connection, name, token)
+                else:
+                    log.info('%s has an invalid ticket', name)
+                    self.tempConnections.remove(connection)
+                    self.server.sendData(('fail', name), connection)
+            elif package[0] == 'resume':
+                name, token = package[1]
+                if requireTicket.getValue() and not self.findUser(name):
+                    # only a player that got in with a ticket can come back
+                    log.info('%s has nothing to resume', name)
+                    self.tempConnections.remove(connection)
+                    self.server.sendData(('fail', name), connection)
+                else:
+                    self.authenticate(connection, name, token)
+
+    def findUser(self, name):
+        for user in self.currentPlayers:
+            if user.name == name:
+                return user
+        return None
+
+    def authenticate(self, connection, name, token=None):
+        log.info('attempting to authenticate %s', name)
+        self.tempConnections.remove(connection)
+
+        user = self.findUser(name)
+        if user:
+            # a taken name can only be reclaimed by the player that dropped it
+            if user.connection or token != user.token:
+                self.server.sendData(('fail', name), connection)
+                return
+            log.info('%s resumed', name)
+            user.connection = connection
+        else:
+            user = User(name, connection)
+            user.token = os.urandom(16).encode('hex')
+            self.currentPlayers.append(user)
+            self.broadcastData(('join', user.name), exclude=user)
+
+        # confirm authorization
+        self.server.sendData(('auth', (user.name, user.token)), user.connection)
+        # the new player gets the whole roster, everyone else a diff
+        self.server.sendData(('roster', self.rosterSnapshot()), user.connection)
+        if self.inRound:
+            user.sendQueue = SendQueue(self.gameData.tickRate)
+            self.sendSnapshot(user)
+
+    def sendSnapshot(self, user):
+        # Bring a late or returning player up to the current tick, the ticks
+        # that follow are sent to them as to everyone else
+        names = tuple(player.name for player in self.roundPlayers)
+        self.server.sendData(('gamedata', self.gameData.packageData()), user.connection)
+        self.server.sendData(('snapshot', (names, self.game.getSnapshot(self.tick))), user.connection)
+        log.info('sent %s the state of tick %d', user.name, self.tick)
 
     def returnToLobby(self):
         self.taskMgr.doMethodLater(0.5, self.cleanupAndStartLobby, 'Return To Lobby')
@@ -101,13 +221,16 @@ class GameServer(ShowBase):
     def cleanupAndStartLobby(self, task):
         self.cleanupGame()
 
-        for currentPlayer in self.currentPlayers:
-            self.server.sendData(('reset', 'bloop'), currentPlayer.connection)
-            for existing in self.currentPlayers:
-                self.server.sendData(('client', existing.name), currentPlayer.connection)
-                self.server.sendData(('ready', (existing.name, existing.ready)), currentPlayer.connection)
+        # players that never came back lose their place
+        for user in list(self.currentPlayers):
+            user.gameData = None
+            if not user.connection:
+                self.currentPlayers.remove(user)
 
-        self.taskMgr.doMethodLater(0.5, self.lobbyLoop, 'Lobby Loop')
+        # one snapshot replaces whatever roster the clients had
+        self.broadcastData(('roster', self.rosterSnapshot()))
+
+        self.taskMgr.add(self.lobbyLoop, 'Lobby Loop')
 
         return task.done
 
@@ -118,26 +241,30 @@ class GameServer(ShowBase):
                 packet = package[0]
                 connection = package[1]
 
-                print "Received: ", str(package)
+                log.debug("Received: %s", package)
                 if len(packet) == 2:
                     # check to make sure connection has username
                     for user in self.currentPlayers:
                         if user.connection == connection:
                             # if chat packet
                             if packet[0] == 'chat':
-                                print 'Chat: ', packet[1]
+                                log.info('Chat: %s', packet[1])
                                 # Broadcast data to all clients ("username: message")
                                 self.broadcastData(('chat', (user.name, packet[1])))
                             # else if ready packet
                             elif packet[0] == 'ready':
-                                print user.name, ' changed readyness!'
+                                log.info('%s changed readyness!', user.name)
                                 user.ready = packet[1]
                                 self.broadcastData(('ready', (user.name, user.ready)))
+                            # else if loading progress packet
+                            elif packet[0] == 'loading':
+                                user.loadProgress = packet[1]
+                                self.broadcastData(('loading', (user.name, user.loadProgress)))
                             # else if disconnect packet
                             elif packet[0] == 'disconnect':
-                                print user.name, ' is disconnecting!'
+                                log.info('%s is disconnecting!', user.name)
                                 self.currentPlayers.remove(user)
-                                self.broadcastData(('disconnect', user.name))
+                                self.broadcastData(('leave', user.name))
                             # break out of for loop
                             break
         # if all players are ready and there is X of them
@@ -151,7 +278,7 @@ class GameServer(ShowBase):
         if gameReady:
             self.prepareGame()
             return task.done
-        return task.again
+        return task.cont
 
     def prepareGame(self):
         if self.camera:
@@ -166,88 +293,227 @@ class GameServer(ShowBase):
         # game data
         self.broadcastData(('gamedata', self.gameData.packageData()))
         self.broadcastData(('state', 'preround'))
-        print "Preparing Game"
+        log.info("Preparing Game")
         self.gameTime = 0
         self.tick = 0
+        self.pingTime = 0
 
         usersData = []
-        for user in self.currentPlayers:
+        self.roundPlayers = list(self.currentPlayers)
+        self.inRound = True
+        for user in self.roundPlayers:
             user.gameData = UserData()
+            user.sync = False
+            user.sendQueue = SendQueue(self.gameData.tickRate)
             usersData.append(user.gameData)
-        print usersData
-        self.game = Game(self, usersData, self.gameData)
-        self.taskMgr.doMethodLater(0.5, self.roundReadyLoop, 'Game Loop')
-        print "Round ready State"
+        log.debug("%s", usersData)
+        # the match scene is kept between rounds and reset in place
+        if self.game:
+            self.game.startRound(usersData, self.gameData)
+        else:
+            self.game = Game(self, usersData, self.gameData)
+        # who gets detailed updates about whom, from centipede head distance
+        self.interest = InterestManager(self.game.kinematics)
+        self.syncTime = 0
+        # check the sync barrier every frame so the round starts as soon as
+        # the last player has loaded
+        self.taskMgr.add(self.roundReadyLoop, 'Game Loop')
+        log.info("Round ready State")
 
     def cleanupGame(self):
-        self.game.destroy()
-        self.game = None
+        self.game.endRound()
 
     def roundReadyLoop(self, task):
         temp = self.getData()
         for package in temp:
             if len(package) == 2:
-                print "Received: ", str(package)
+                log.debug("Received: %s", package)
                 if len(package[0]) == 2:
                     for user in self.currentPlayers:
                         if user.connection == package[1]:
                             if package[0][0] == 'round':
                                 if package[0][1] == 'sync':
                                     user.sync = True
+                                    user.loadProgress = 1.0
+                            elif package[0][0] == 'loading':
+                                user.loadProgress = package[0][1]
+                                self.broadcastData(('loading', (user.name, user.loadProgress)))
+        self.syncTime += self.taskMgr.globalClock.getDt()
         # if all players are ready and there is X of them
         roundReady = True
         # if there is any clients connected
-        for user in self.currentPlayers:
-            if not user.sync:
+        for user in self.roundPlayers:
+            if user.connection and not user.sync:
                 roundReady = False
+        if not roundReady and self.syncTime > syncTimeout:
+            for user in self.roundPlayers:
+                if not user.sync:
+                    log.warning("%s timed out loading at %.2f", user.name, user.loadProgress)
+            roundReady = True
         if roundReady:
-            self.taskMgr.doMethodLater(2.5, self.gameLoop, 'Game Loop')
-            print "Game State"
+            self.gameTime = 0
+            self.roundStarted = time.time()
+            self.gcController.startRound()
+            self.taskMgr.add(self.gameLoop, 'Game Loop')
+            log.info("Game State")
             return task.done
-        return task.again
+        return task.cont
+
+    def sendUpdate(self, subject, packet):
+        # Detailed updates only go to players the subject is relevant to
+        subjectIndex = subject.gameData.centipede.index
+        for user in self.currentPlayers:
+            if not user.connection:
+                continue
+            if user.gameData and not self.interest.isRelevant(user.gameData.centipede.index, subjectIndex):
+                continue
+            user.sendQueue.add((subject.name, packet))
+
+    def sendCoarseUpdates(self):
+        # Everyone else gets the authoritative state of the subject now and then
+        for user in self.roundPlayers:
+            if not user.connection:
+                continue
+            observer = user.gameData.centipede.index
+            drifting = False
+            for subject in self.roundPlayers:
+                centipede = subject.gameData.centipede
+                if not self.interest.isRelevant(observer, centipede.index):
+                    user.sendQueue.add((subject.name, ('updateState', centipede.getStateUpdate())))
+                    drifting = True
+            if drifting:
+                self.sendCorrections(user, [])
+
+    def sendResyncs(self):
+        # A subject that has just become relevant was only coarsely followed
+        # by the observer until now, from here on the observer runs it in
+        # lockstep again so it has to start from the server's exact state
+        players = dict((user.gameData.centipede.index, user) for user in self.roundPlayers)
+        entered = {}
+        for observer, subject in self.interest.entered:
+            entered.setdefault(observer, []).append(players[subject])
+        for observer, subjects in entered.items():
+            if players[observer].connection:
+                self.sendCorrections(players[observer], subjects)
+
+    def sendCorrections(self, user, subjects):
+        # Exact state of subjects, the foods and the player's own centipede,
+        # for a player whose copies of distant centipedes may have drifted:
+        # such a copy can eat different food, which can change what the
+        # player's own centipede runs into
+        for subject in subjects + [user]:
+            user.sendQueue.add((subject.name, ('updateSnapshot', subject.gameData.centipede.getSnapshot())))
+        user.sendQueue.add(('foods', self.game.getFoodStates()))
+
+    def queueForAll(self, message):
+        for user in self.currentPlayers:
+            if user.connection:
+                user.sendQueue.add(message)
+
+    def flushUpdates(self, force=False):
+        # Send each client its bundle once its send interval has passed
+        for user in self.currentPlayers:
+            due = user.sendQueue.tickDone()
+            if not user.connection:
+                user.sendQueue.take()
+            elif due or force:
+                self.server.sendData(('bundle', user.sendQueue.take()), user.connection)
+                self.profiler.count('messages_sent')
+
+    def storeResults(self):
+        # Queue the round's results, the store writes them on its own thread
+        if not self.statsStore:
+            return
+        results = []
+        winner = None
+        longest = -1
+        for user, stats in zip(self.roundPlayers, self.game.stats):
+            results.append((user.name,) + stats.getResult())
+            length = len(user.gameData.centipede.body)
+            if length > longest:
+                winner, longest = user.name, length
+        self.statsStore.recordMatch(self.address, self.roundStarted, time.time(), self.tick, winner, results)
+
+    def sendPings(self, dt):
+        # Round trip times steer every client's send rate
+        self.pingTime += dt
+        if self.pingTime < pingInterval.getValue():
+            return
+        self.pingTime = 0
+        now = self.taskMgr.globalClock.getRealTime()
+        for user in self.currentPlayers:
+            if user.connection:
+                self.server.sendData(('ping', now), user.connection)
 
     def gameLoop(self, task):
+        profiler = self.profiler
         # process incoming packages
+        started = profiler.start('ingest')
         temp = self.getData()
+        profiler.stop('ingest', started)
+        profiler.gauge('queue_depth', len(temp))
+        profiler.gauge('connections', len([user for user in self.currentPlayers if user.connection]))
+
+        started = profiler.start('input')
         for package in temp:
-            if len(package) == 2:
-                # check to make sure connection has username
+            # lost connections are passed on without one
+            if len(package) == 2 and package[1]:
+                packet = package[0]
                 for user in self.currentPlayers:
-                    if user.connection == package[1]:
-                        try:
-                            user.gameData.processUpdatePacket(package[0])
-                        except AttributeError:
-                            print "Player must have joined mid game! :O"
+                    if user.connection != package[1]:
+                        continue
+                    if len(packet) == 2 and packet[0] == 'pong':
+                        user.sendQueue.pong(self.taskMgr.globalClock.getRealTime() - packet[1])
+                    elif user.gameData and len(packet) == 2 and packet[0] == 'updateDest':
+                        # only players of the round steer, late joiners watch.
+                        # updateState is the server's to send, never a player's
+                        user.gameData.processUpdatePacket(packet)
+        profiler.stop('input', started)
 
         # get frame delta time
         dt = self.taskMgr.globalClock.getDt()
         self.gameTime += dt
+        self.sendPings(dt)
         # if time is less than 3 secs (countdown for determining pings of clients?)
         # tick out for clients
         while self.gameTime > gameTick:
+            tickStarted = profiler.start('tick')
             # update all clients with new info before saying tick
-            for user in self.currentPlayers:
-                try:
-                    updates = user.gameData.makeUpdatePackets()
-                    for packet in updates:
-                        self.broadcastData((user.name, packet))
-                except AttributeError:
-                    print "Player must have joined mid game! :O"
-            self.broadcastData(('tick', self.tick))
+            started = profiler.start('broadcast')
+            self.interest.update()
+            self.sendResyncs()
+            for user in self.roundPlayers:
+                for packet in user.gameData.makeUpdatePackets():
+                    self.sendUpdate(user, packet)
+            if self.interest.coarseDue(self.tick):
+                self.sendCoarseUpdates()
+            self.queueForAll(('tick', self.tick))
+            self.flushUpdates()
+            profiler.stop('broadcast', started)
             self.gameTime -= gameTick
             self.tick += 1
             # run simulation
-            if not self.game.runTick(gameTick, self.tick):
-                print 'Game Over'
+            running = self.game.runTick(gameTick, self.tick)
+            profiler.tickDone(tickStarted)
+            if not running:
+                log.info('Game Over')
+                self.inRound = False
+                self.gcController.endRound()
+                # clients have to run every tick up to the end
+                self.flushUpdates(force=True)
                 self.broadcastData(("game", "over"))
                 # send to all players that game is over (they know already but whatever)
                 # and send final game data/scores/etc
                 for user in self.currentPlayers:
                     user.ready = False
+                profiler.writeRoundSummary()
+                self.storeResults()
                 self.returnToLobby()
                 return task.done
+        self.game.syncNodes()
+        # collect garbage in whatever time is left before the next tick
+        self.gcController.idle(gameTick - self.gameTime)
         return task.cont
 
-
 gameServer = GameServer()
 gameServer.run()
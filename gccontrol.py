@@ -0,0 +1,87 @@
+import gc
+from timeit import default_timer
+
+from panda3d.core import ConfigVariableBool, ConfigVariableDouble, ConfigVariableInt
+
+# take the cyclic collector off automatic during rounds
+gcControl = ConfigVariableBool('gc-control', True)
+# longest a collection may be expected to take in the slack before a tick
+gcIdleBudget = ConfigVariableDouble('gc-idle-budget', 0.004)
+# young objects allowed to pile up before a collection is forced anyway
+gcForceFactor = ConfigVariableInt('gc-force-factor', 20)
+
+
+# GcController Class
+# While a round runs the collector is only run from idle(), with the time
+# left before the next tick. The youngest generation that is due is collected
+# if its expected pause (the last pause of that generation) fits both the
+# slack and gc-idle-budget. Long lived objects from round setup are moved out
+# of the way first: frozen where gc.freeze exists, otherwise collected into
+# the oldest generation. Pauses are recorded as gc0, gc1 and gc2 phases of
+# the tick profiler.
+class GcController(object):
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self.enabled = gcControl.getValue()
+        self.active = False
+        self.pauses = [0.0, 0.0, 0.0]
+
+    def startRound(self):
+        if not self.enabled:
+            return
+        # the full collection also tells what an oldest generation pass costs
+        timer = default_timer()
+        gc.collect()
+        self.pauses[2] = default_timer() - timer
+        if hasattr(gc, 'freeze'):
+            gc.freeze()
+        gc.disable()
+        self.active = True
+
+    def endRound(self):
+        if not self.active:
+            return
+        self.active = False
+        if hasattr(gc, 'unfreeze'):
+            gc.unfreeze()
+        gc.enable()
+
+    def dueGeneration(self):
+        # Oldest generation whose threshold has been passed, or -1
+        counts = gc.get_count()
+        thresholds = gc.get_threshold()
+        due = -1
+        for generation in range(3):
+            if thresholds[generation] and counts[generation] >= thresholds[generation]:
+                due = generation
+            else:
+                break
+        return due
+
+    def idle(self, slack):
+        # Collect in the time left before the next tick, if anything is due
+        if not self.active:
+            return
+        due = self.dueGeneration()
+        self.profiler.gauge('gc_pending', gc.get_count()[0])
+        if due < 0:
+            return
+        budget = min(slack, gcIdleBudget.getValue())
+        # drop to a younger generation when the due one would not fit
+        while due > 0 and self.pauses[due] > budget:
+            due -= 1
+        if self.pauses[due] > budget:
+            # not even the youngest fits, only collect once it has grown too far
+            if gc.get_count()[0] < gc.get_threshold()[0] * gcForceFactor.getValue():
+                return
+            self.profiler.count('gc_forced')
+        self.collect(due)
+
+    def collect(self, generation):
+        phase = 'gc%d' % generation
+        started = self.profiler.start(phase)
+        timer = default_timer()
+        gc.collect(generation)
+        self.pauses[generation] = default_timer() - timer
+        self.profiler.stop(phase, started)
+        self.profiler.count('gc_collections')
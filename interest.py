@@ -0,0 +1,45 @@
+import numpy as np
+from panda3d.core import ConfigVariableDouble, ConfigVariableInt
+
+# players closer than this get each others detailed updates
+interestRadius = ConfigVariableDouble('interest-radius', 60.0)
+# extra distance before a relevant player stops being relevant
+interestHysteresis = ConfigVariableDouble('interest-hysteresis', 15.0)
+# ticks between coarse state updates for players that are not relevant
+interestCoarseInterval = ConfigVariableInt('interest-coarse-interval', 15)
+
+
+# InterestManager Class
+# Keeps, for every centipede, the set of other centipedes whose heads are
+# within the interest radius. A pair becomes relevant inside the radius and
+# only stops being relevant beyond radius + hysteresis, so players near the
+# edge do not flicker in and out.
+class InterestManager(object):
+    def __init__(self, kinematics):
+        self.kinematics = kinematics
+        self.enterRadius = interestRadius.getValue()
+        self.leaveRadius = self.enterRadius + interestHysteresis.getValue()
+        self.coarseInterval = max(1, interestCoarseInterval.getValue())
+
+        count = kinematics.numCentipedes
+        self.relevant = np.ones((count, count), dtype=bool)
+        # (observer, subject) pairs that became relevant in the last update,
+        # the observer's copy of the subject may have drifted until then
+        self.entered = []
+        self.update()
+
+    def update(self):
+        x = self.kinematics.x[:, 0]
+        y = self.kinematics.y[:, 0]
+        distance = np.hypot(x[:, None] - x[None, :], y[:, None] - y[None, :])
+        relevant = np.where(self.relevant, distance < self.leaveRadius, distance < self.enterRadius)
+        # a player is always relevant to themself
+        np.fill_diagonal(relevant, True)
+        self.entered = [(int(observer), int(subject)) for observer, subject in np.argwhere(relevant & ~self.relevant)]
+        self.relevant = relevant
+
+    def isRelevant(self, observer, subject):
+        return self.relevant[observer, subject]
+
+    def coarseDue(self, tick):
+        return tick % self.coarseInterval == 0
@@ -0,0 +1,285 @@
+import numpy as np
+
+
+def blendChains(chains, alpha):
+    # Chains alpha of the way from the previous step to the current one, from
+    # (x, y, h, prevX, prevY, prevH) arrays
+    x, y, h, prevX, prevY, prevH = chains
+    if alpha >= 1.0:
+        return x, y, h
+    blendX = prevX + (x - prevX) * alpha
+    blendY = prevY + (y - prevY) * alpha
+    # headings take the short way round
+    blendH = prevH + ((h - prevH + 180.0) % 360.0 - 180.0) * alpha
+    return blendX, blendY, blendH
+
+
+# Kinematics Class
+# Structure-of-arrays store for every centipede in a match. Row c holds the
+# chain of centipede c: column 0 is the head, columns 1..count[c] are the body
+# segments and column count[c] + 1 is the tail.
+# Only the heads are simulated. Every head records its path into a ring
+# buffer of positions with their cumulative arc length, and node j of a chain
+# is placed on that trail j * spacing behind the head.
+class Kinematics(object):
+    def __init__(self, numCentipedes, speed=25.0, turnRate=90.0, capacity=16, trailSize=256):
+        self.numCentipedes = numCentipedes
+        self.speed = speed
+        self.turnRate = turnRate
+
+        self.x = np.zeros((numCentipedes, capacity))
+        self.y = np.zeros((numCentipedes, capacity))
+        self.h = np.zeros((numCentipedes, capacity))
+        # chains as they were before the last step, for drawing in between
+        self.prevX = np.zeros((numCentipedes, capacity))
+        self.prevY = np.zeros((numCentipedes, capacity))
+        self.prevH = np.zeros((numCentipedes, capacity))
+
+        # number of body segments (excluding head and tail) per centipede
+        self.count = np.zeros(numCentipedes, dtype=np.int32)
+        # distance kept between neighbouring nodes of a chain
+        self.spacing = np.ones(numCentipedes)
+
+        self.destX = np.zeros(numCentipedes)
+        self.destY = np.zeros(numCentipedes)
+
+        # head trails, trailHead is the column of the newest sample and
+        # trailCount the number of samples recorded (at most trailSize).
+        # Every trail starts with two samples, see reset.
+        self.trailX = np.zeros((numCentipedes, trailSize))
+        self.trailY = np.zeros((numCentipedes, trailSize))
+        self.trailS = np.zeros((numCentipedes, trailSize))
+        self.trailHead = np.ones(numCentipedes, dtype=np.int32)
+        self.trailCount = np.ones(numCentipedes, dtype=np.int32) * 2
+
+    def capacity(self):
+        return self.x.shape[1]
+
+    def grow(self, capacity):
+        # Double the number of chain columns until capacity fits
+        newCapacity = self.capacity()
+        while newCapacity < capacity:
+            newCapacity *= 2
+        if newCapacity == self.capacity():
+            return
+        extra = newCapacity - self.capacity()
+        padding = np.zeros((self.numCentipedes, extra))
+        self.x = np.hstack((self.x, padding))
+        self.y = np.hstack((self.y, padding))
+        self.h = np.hstack((self.h, padding))
+        self.prevX = np.hstack((self.prevX, padding))
+        self.prevY = np.hstack((self.prevY, padding))
+        self.prevH = np.hstack((self.prevH, padding))
+
+    def trailSize(self):
+        return self.trailX.shape[1]
+
+    def growTrail(self, size):
+        # Double the trail length until size fits, unrolling every ring so
+        # that its newest sample ends up in the last old column
+        oldSize = self.trailSize()
+        newSize = oldSize
+        while newSize < size:
+            newSize *= 2
+        if newSize == oldSize:
+            return
+        rows = np.arange(self.numCentipedes)[:, None]
+        order = (self.trailHead[:, None] - np.arange(oldSize - 1, -1, -1)[None, :]) % oldSize
+        padding = np.zeros((self.numCentipedes, newSize - oldSize))
+        self.trailX = np.hstack((self.trailX[rows, order], padding))
+        self.trailY = np.hstack((self.trailY[rows, order], padding))
+        self.trailS = np.hstack((self.trailS[rows, order], padding))
+        self.trailHead[:] = oldSize - 1
+
+    def setSpacing(self, index, spacing):
+        self.spacing[index] = spacing
+
+    def setDestination(self, index, x, y):
+        self.destX[index] = x
+        self.destY[index] = y
+
+    def tailIndex(self, index):
+        return self.count[index] + 1
+
+    def reset(self, index, x, y, h):
+        self.count[index] = 0
+        radians = np.radians(h)
+        # Set position and rotation of centipede head
+        self.x[index, 0] = x
+        self.y[index, 0] = y
+        self.h[index, 0] = h
+        # Start the trail as a straight line out behind the head, the chain
+        # carries on along it until the head has moved far enough
+        self.trailX[index, :2] = (x + np.sin(radians) * self.spacing[index], x)
+        self.trailY[index, :2] = (y - np.cos(radians) * self.spacing[index], y)
+        self.trailS[index, :2] = (0.0, self.spacing[index])
+        self.trailHead[index] = 1
+        self.trailCount[index] = 2
+        self.placeChain(index)
+        # Destination is one unit in front of the head
+        self.destX[index] = x - np.sin(radians)
+        self.destY[index] = y + np.cos(radians)
+        self.snap(index)
+
+    def addSegment(self, index):
+        # The new body segment takes the place of the tail and the tail moves
+        # one spacing further down the trail
+        self.grow(self.tailIndex(index) + 2)
+        self.count[index] += 1
+        tail = self.tailIndex(index)
+        self.h[index, tail] = self.h[index, tail - 1]
+        self.placeChain(index)
+        self.snap(index)
+
+    def removeSegment(self, index):
+        # The tail takes the place of the last body segment
+        self.count[index] -= 1
+        self.placeChain(index)
+        self.snap(index)
+
+    def snap(self, index):
+        # A chain that changed shape is drawn where it is, not blended
+        self.prevX[index] = self.x[index]
+        self.prevY[index] = self.y[index]
+        self.prevH[index] = self.h[index]
+
+    def setHead(self, index, x, y, h):
+        # The jump becomes part of the trail and the chain follows it
+        self.x[index, 0] = x
+        self.y[index, 0] = y
+        self.h[index, 0] = h
+        self.record(np.array([index]))
+        self.placeChain(index)
+
+    def getTrail(self, index):
+        # Samples of a trail oldest first, as (arc lengths, x, y)
+        order = (self.trailHead[index] - np.arange(self.trailCount[index] - 1, -1, -1)) % self.trailSize()
+        return self.trailS[index, order], self.trailX[index, order], self.trailY[index, order]
+
+    def setTrail(self, index, s, x, y):
+        count = len(s)
+        self.growTrail(count)
+        self.trailS[index, :count] = s
+        self.trailX[index, :count] = x
+        self.trailY[index, :count] = y
+        self.trailHead[index] = count - 1
+        self.trailCount[index] = count
+        self.placeChain(index)
+
+    def step(self, dt, multi=1.0):
+        self.prevX[:] = self.x
+        self.prevY[:] = self.y
+        self.prevH[:] = self.h
+        self.updateRotation(dt)
+        self.moveForwards(dt, multi)
+
+    def updateRotation(self, dt):
+        oldH = self.h[:, 0]
+        dx = self.destX - self.x[:, 0]
+        dy = self.destY - self.y[:, 0]
+        # Heading that would point the head at its destination
+        newH = np.where((dx == 0.0) & (dy == 0.0), oldH, np.degrees(np.arctan2(-dx, dy)))
+        # Fit destination angle to within 180 degrees of the current heading
+        diff = (newH - oldH + 180.0) % 360.0 - 180.0
+        change = np.where(diff < 0.0, -dt * self.turnRate, dt * self.turnRate)
+        arrived = np.abs(diff) < np.abs(change)
+
+        h = np.where(arrived, oldH + diff, oldH + change)
+        self.h[:, 0] = h
+
+        # Heads that reached their heading keep a destination just in front
+        radians = np.radians(h)
+        self.destX = np.where(arrived, self.x[:, 0] - np.sin(radians), self.destX)
+        self.destY = np.where(arrived, self.y[:, 0] + np.cos(radians), self.destY)
+
+    def moveForwards(self, dt, multi):
+        # Update centipede head positions
+        radians = np.radians(self.h[:, 0])
+        distance = dt * multi * self.speed
+        self.x[:, 0] -= np.sin(radians) * distance
+        self.y[:, 0] += np.cos(radians) * distance
+        if not self.numCentipedes or distance <= 0.0:
+            return
+
+        # Every trail has to reach back along the longest chain
+        reach = (self.count.max() + 1) * self.spacing.max()
+        self.growTrail(int(reach / distance) + 2)
+
+        rows = np.arange(self.numCentipedes)
+        self.record(rows)
+        self.placeChains(rows)
+
+    def record(self, rows):
+        # Append the current head positions of rows to their trails
+        last = self.trailHead[rows]
+        x = self.x[rows, 0]
+        y = self.y[rows, 0]
+        moved = np.hypot(x - self.trailX[rows, last], y - self.trailY[rows, last])
+        head = (last + 1) % self.trailSize()
+        self.trailS[rows, head] = self.trailS[rows, last] + moved
+        self.trailX[rows, head] = x
+        self.trailY[rows, head] = y
+        self.trailHead[rows] = head
+        self.trailCount[rows] = np.minimum(self.trailCount[rows] + 1, self.trailSize())
+
+    def placeChain(self, index):
+        self.placeChains(np.array([index]))
+
+    def placeChains(self, rows):
+        # Place body and tail of the chains of rows at multiples of spacing
+        # down their trails, every row in one batch
+        n = len(rows)
+        r = rows[:, None]
+        # Samples oldest first, rows with fewer samples than the longest are
+        # padded at the front with their oldest one
+        count = self.trailCount[rows]
+        width = int(count.max())
+        back = np.minimum(np.arange(width - 1, -1, -1)[None, :], count[:, None] - 1)
+        order = (self.trailHead[r] - back) % self.trailSize()
+        s = self.trailS[r, order]
+        trailX = self.trailX[r, order]
+        trailY = self.trailY[r, order]
+
+        last = self.count[rows] + 1
+        columns = int(last.max())
+        targets = s[:, -1:] - np.arange(1, columns + 1)[None, :] * self.spacing[r]
+
+        # One search for every row: arc lengths are taken from each row's
+        # oldest sample and the rows moved apart so they cannot overlap
+        targets = targets - s[:, :1]
+        s = s - s[:, :1]
+        stride = s[:, -1].max() + 1.0
+        offsets = np.arange(n)[:, None] * stride
+        found = np.searchsorted((s + offsets).ravel(), (np.maximum(targets, 0.0) + offsets).ravel(), side='right')
+        # sample each target lies after, past the oldest real sample the
+        # first segment carries on in a straight line
+        lower = np.clip(found.reshape(n, columns) - 1 - np.arange(n)[:, None] * width,
+                        (width - count)[:, None], width - 2)
+        upper = lower + 1
+        batch = np.arange(n)[:, None]
+        span = s[batch, upper] - s[batch, lower]
+        fraction = np.where(span > 0.0, (targets - s[batch, lower]) / np.where(span > 0.0, span, 1.0), 0.0)
+        x = trailX[batch, lower] + (trailX[batch, upper] - trailX[batch, lower]) * fraction
+        y = trailY[batch, lower] + (trailY[batch, upper] - trailY[batch, lower]) * fraction
+
+        nodes = np.arange(1, columns + 1)[None, :]
+        placed = nodes <= last[:, None]
+        self.x[r, nodes] = np.where(placed, x, self.x[r, nodes])
+        self.y[r, nodes] = np.where(placed, y, self.y[r, nodes])
+
+        # every node faces the one in front of it, where that one is now
+        dx = self.x[r, nodes - 1] - self.x[r, nodes]
+        dy = self.y[r, nodes - 1] - self.y[r, nodes]
+        facing = placed & ((dx != 0.0) | (dy != 0.0))
+        self.h[r, nodes] = np.where(facing, np.degrees(np.arctan2(-dx, dy)), self.h[r, nodes])
+
+    def getChains(self):
+        # The arrays blendChains draws from
+        return self.x, self.y, self.h, self.prevX, self.prevY, self.prevH
+
+    def getHead(self, index):
+        return self.x[index, 0], self.y[index, 0], self.h[index, 0]
+
+    def outOfBounds(self, limit):
+        # Indices of centipedes whose head has left the arena
+        return np.nonzero((np.abs(self.x[:, 0]) > limit) | (np.abs(self.y[:, 0]) > limit))[0]
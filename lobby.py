@@ -3,7 +3,9 @@ from direct.gui.OnscreenText import OnscreenText
 from direct.showbase.DirectObject import DirectObject
 from panda3d.core import Vec3, TextNode
 
+from assets import texturePath
 from gamedata import GameData
+from preload import Preloader
 from user import User
 
 
@@ -18,7 +20,7 @@ class Lobby(DirectObject):
 
         self.background = DirectFrame(
             frameSize=(-1, 1, -1, 1),
-            frameTexture='media/gui/mainmenu/menu.png',
+            frameTexture=texturePath('media/gui/mainmenu/menu.png'),
             parent=self.showbase.render2d,
         )
 
@@ -44,45 +46,80 @@ class Lobby(DirectObject):
 
         self.ready = False
 
+        # users in join order, which is the order centipedes are handed out
+        # in, and the same users indexed by name
         self.showbase.users = []
+        self.showbase.usersByName = {}
+
+        # load round assets while players sit in the lobby, unless loading
+        # already started behind the login screen
+        self.preloader = self.showbase.preloader
+        if self.preloader:
+            self.preloader.progressHandler = self.reportProgress
+            self.reportProgress(self.preloader.progress())
+        else:
+            self.preloader = Preloader(self.showbase, self.reportProgress)
+
+    def reportProgress(self, progress):
+        self.status.setText('Loading %d%%' % (progress * 100) if progress < 1.0 else '')
+        self.showbase.client.sendData(('loading', progress))
 
     def updateLobby(self, task):
         temp = self.showbase.client.getData()
-        for package in temp:
+        for i, package in enumerate(temp):
             if len(package) == 2:
-                print 'Received: ', str(package)
-                if package[0] == 'reset':
-                    self.showbase.users = []
-                    print 'cleared users'
-                elif package[0] == 'client':
-                    self.showbase.users.append(User(package[1]))
-                    for user in self.showbase.users:
-                        print user.name, user.ready
-                    print 'all users'
+                if package[0] == 'roster':
+                    self.setRoster(package[1])
+                elif package[0] == 'join':
+                    self.addUser(package[1])
+                elif package[0] == 'leave':
+                    self.removeUser(package[1])
                 elif package[0] == 'ready':
-                    for user in self.showbase.users:
-                        if user.name == package[1][0]:
-                            user.ready = package[1][1]
-                    for user in self.showbase.users:
-                        print user.name, user.ready
-                    print 'all users'
-                elif package[0] == 'disconnect':
-                    for user in self.showbase.users:
-                        if user.name == package[1]:
-                            self.showbase.users.remove(user)
-                    for user in self.showbase.users:
-                        print user.name, user.ready
-                    print 'all users'
+                    user = self.showbase.usersByName.get(package[1][0])
+                    if user:
+                        user.ready = package[1][1]
+                elif package[0] == 'loading':
+                    user = self.showbase.usersByName.get(package[1][0])
+                    if user:
+                        user.loadProgress = package[1][1]
                 elif package[0] == 'gamedata':
                     self.showbase.gameData = GameData()
                     self.showbase.gameData.unpackageData(package[1])
                 elif package[0] == 'state':
                     print 'state: ', package[1]
                     if package[1] == 'preround':
-                        self.showbase.startRound()
+                        self.startRound(temp[i + 1:])
                         return task.done
+                elif package[0] == 'snapshot':
+                    # joined while a round is running
+                    self.showbase.snapshot = package[1]
+                    self.startRound(temp[i + 1:])
+                    return task.done
         return task.again
 
+    def startRound(self, remaining):
+        # whatever arrived after the round started belongs to the round
+        for package in remaining:
+            self.showbase.client.passData(package)
+        self.showbase.startRound()
+
+    def setRoster(self, roster):
+        self.showbase.users = []
+        self.showbase.usersByName = {}
+        for name, ready in roster:
+            self.addUser(name).ready = ready
+
+    def addUser(self, name):
+        user = User(name)
+        self.showbase.users.append(user)
+        self.showbase.usersByName[name] = user
+        return user
+
+    def removeUser(self, name):
+        user = self.showbase.usersByName.pop(name, None)
+        if user:
+            self.showbase.users.remove(user)
+
     def toggleReady(self):
         self.ready = not self.ready
         self.showbase.client.sendData(('ready', self.ready))
@@ -0,0 +1,91 @@
+from panda3d.core import ConfigVariableDouble, ConfigVariableInt, PStatCollector
+
+from animation import NEAR, REDUCED, FROZEN, LOW
+
+# Camera distances at which actors drop to the next animation tier, chosen
+# against the CameraHandler zoom range of 25 to 500
+lodReducedDistance = ConfigVariableDouble('lod-reduced-distance', 150.0)
+lodFrozenDistance = ConfigVariableDouble('lod-frozen-distance', 300.0)
+lodLowDistance = ConfigVariableDouble('lod-low-distance', 450.0)
+# most actors allowed full rate animation at once, the rest are reduced
+lodNearBudget = ConfigVariableInt('lod-near-budget', 48)
+
+
+# LodManager Class
+# Picks an animation and geometry tier for every centipede segment and food
+# from its distance to the camera and whether it is in view
+class LodManager(object):
+    def __init__(self, showbase, game, interval=0.2):
+        self.showbase = showbase
+        self.game = game
+        # how often tiers are reassigned, in seconds
+        self.interval = interval
+        self.timer = interval
+
+        self.animations = [game.centipedeAnimation, game.foodAnimation]
+        for animation in self.animations:
+            animation.loadLowDetail(showbase.loader)
+
+        self.collectors = {
+            NEAR: PStatCollector('LOD:Near'),
+            REDUCED: PStatCollector('LOD:Reduced'),
+            FROZEN: PStatCollector('LOD:Frozen'),
+            LOW: PStatCollector('LOD:Low'),
+        }
+        self.culledCollector = PStatCollector('LOD:Culled')
+        self.counts = dict((tier, 0) for tier in self.collectors)
+        self.culled = 0
+
+    def entities(self):
+        for user in self.game.usersData:
+            for node in user.centipede.chain():
+                yield node, self.game.centipedeAnimation
+        for food in self.game.foods:
+            yield food.model, self.game.foodAnimation
+
+    def update(self, dt):
+        for animation in self.animations:
+            animation.update(dt)
+
+        self.timer += dt
+        if self.timer < self.interval:
+            return
+        self.timer = 0.0
+
+        cam = self.showbase.cam
+        camNode = self.showbase.camNode
+        render = self.showbase.render
+
+        visible = []
+        culled = []
+        for node, animation in self.entities():
+            point = cam.getRelativePoint(render, node.getPos())
+            if camNode.isInView(point):
+                visible.append((point.length(), node, animation))
+            else:
+                culled.append((node, animation))
+
+        counts = dict((tier, 0) for tier in self.collectors)
+        # Closest actors get full rate animation until the budget runs out
+        visible.sort(key=lambda entry: entry[0])
+        for distance, node, animation in visible:
+            if distance >= lodLowDistance.getValue():
+                tier = LOW
+            elif distance >= lodFrozenDistance.getValue():
+                tier = FROZEN
+            elif distance >= lodReducedDistance.getValue() or counts[NEAR] >= lodNearBudget.getValue():
+                tier = REDUCED
+            else:
+                tier = NEAR
+            counts[tier] += 1
+            animation.setTier(node, tier)
+
+        # Nothing off screen needs to animate
+        for node, animation in culled:
+            animation.setTier(node, FROZEN)
+
+        self.counts = counts
+        self.culled = len(culled)
+        for tier, collector in self.collectors.items():
+            collector.setLevel(counts[tier])
+        self.culledCollector.setLevel(self.culled)
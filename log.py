@@ -0,0 +1,144 @@
+import atexit
+import collections
+import sys
+import threading
+import time
+
+from panda3d.core import ConfigVariableBool, ConfigVariableDouble, ConfigVariableInt, ConfigVariableString
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+OFF = 100
+
+levelNames = {DEBUG: 'debug', INFO: 'info', WARNING: 'warning', ERROR: 'error', OFF: 'off'}
+levelValues = dict((name, level) for level, name in levelNames.items())
+
+logLevel = ConfigVariableString('log-level', 'info')
+logFile = ConfigVariableString('log-file', '')
+logStdout = ConfigVariableBool('log-stdout', True)
+logBufferSize = ConfigVariableInt('log-buffer-size', 8192)
+# at most log-rate-burst copies of one message per log-rate-interval seconds
+logRateBurst = ConfigVariableInt('log-rate-burst', 10)
+logRateInterval = ConfigVariableDouble('log-rate-interval', 1.0)
+
+
+# LogWriter Class
+# Records are appended to a bounded deque by the logging thread (a single
+# atomic append, no lock) and formatted and written by a background thread.
+class LogWriter(object):
+    def __init__(self):
+        self.records = collections.deque(maxlen=logBufferSize.getValue())
+        self.file = None
+        if logFile.getValue():
+            self.file = open(logFile.getValue(), 'a')
+        self.stdout = logStdout.getValue()
+
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='Log Writer')
+        self.thread.daemon = True
+        self.thread.start()
+        atexit.register(self.stop)
+
+    def append(self, record):
+        self.records.append(record)
+
+    def run(self):
+        while self.running:
+            self.flush()
+            time.sleep(0.1)
+
+    def flush(self):
+        lines = []
+        while self.records:
+            lines.append(self.format(self.records.popleft()))
+        if not lines:
+            return
+        text = '\n'.join(lines) + '\n'
+        if self.file:
+            self.file.write(text)
+            self.file.flush()
+        if self.stdout:
+            sys.stdout.write(text)
+
+    def format(self, record):
+        stamp, level, category, msg, args = record
+        # messages are only formatted here, off the logging thread
+        if args:
+            try:
+                msg = msg % args
+            except (TypeError, ValueError):
+                msg = '%s %r' % (msg, args)
+        return '%s.%03d %-7s %s: %s' % (time.strftime('%H:%M:%S', time.localtime(stamp)),
+                                        int(stamp * 1000) % 1000, levelNames[level], category, msg)
+
+    def stop(self):
+        self.running = False
+        self.flush()
+
+
+# Logger Class
+# One per category. Level checks happen before anything is built, so calls
+# below the level cost a comparison.
+class Logger(object):
+    def __init__(self, category, writer):
+        self.category = category
+        self.writer = writer
+        self.rates = {}
+
+        level = ConfigVariableString('log-level-' + category, logLevel.getValue()).getValue()
+        self.setLevel(levelValues.get(level, INFO))
+
+    def setLevel(self, level):
+        self.level = level
+        self.debugEnabled = level <= DEBUG
+
+    def allow(self, msg, stamp):
+        # Rate limit repeats of the same message
+        entry = self.rates.get(msg)
+        if entry is None or stamp - entry[0] >= logRateInterval.getValue():
+            if entry is not None and entry[2]:
+                self.writer.append((stamp, WARNING, self.category,
+                                    'suppressed %d repeats of "%s"', (entry[2], msg)))
+            self.rates[msg] = [stamp, 1, 0]
+            return True
+        if entry[1] < logRateBurst.getValue():
+            entry[1] += 1
+            return True
+        entry[2] += 1
+        return False
+
+    def log(self, level, msg, args):
+        if level < self.level:
+            return
+        stamp = time.time()
+        if self.allow(msg, stamp):
+            self.writer.append((stamp, level, self.category, msg, args))
+
+    def debug(self, msg, *args):
+        if self.debugEnabled:
+            self.log(DEBUG, msg, args)
+
+    def info(self, msg, *args):
+        self.log(INFO, msg, args)
+
+    def warning(self, msg, *args):
+        self.log(WARNING, msg, args)
+
+    def error(self, msg, *args):
+        self.log(ERROR, msg, args)
+
+
+writer = None
+loggers = {}
+
+
+def getLogger(category):
+    global writer
+    if writer is None:
+        writer = LogWriter()
+    logger = loggers.get(category)
+    if logger is None:
+        logger = loggers[category] = Logger(category, writer)
+    return logger
@@ -1,11 +1,16 @@
+import time
+
+# startup is measured from here, before Panda or any game module is imported
+launched = time.time()
+
+import importlib
+import json
 import sys
 
 from direct.showbase.ShowBase import ShowBase
-from panda3d.core import loadPrcFileData
+from panda3d.core import ConfigVariableBool, ConfigVariableString, loadPrcFileData
 
 from start import Start
-from lobby import Lobby
-from round import Round
 
 loadPrcFileData(
     "",
@@ -20,24 +25,68 @@ loadPrcFileData(
     """
 )
 
+startupReportFile = ConfigVariableString('startup-report-file', '',
+                                         'Append time to first frame to this file, used by benchstartup.py')
+startupExit = ConfigVariableBool('startup-exit', False, 'Quit as soon as the first frame is drawn')
+
+# The rest of the client, imported one module per frame behind the login screen
+warmupModules = ['lobby', 'round', 'game', 'gamehandler', 'camerahandler', 'centipede', 'food', 'animation', 'lod']
+
 
 class Main(ShowBase):
     start = None
     lobby = None
     round = None
+    # match scene reused by every round
+    game = None
+    # (players, state) of a round joined while it was running
+    snapshot = None
+    # round assets loading since the login screen came up
+    preloader = None
 
     def __init__(self):
         ShowBase.__init__(self)
 
         self.start = Start(self)
 
+        self.warmupQueue = list(warmupModules)
+        # runs after igLoop, so the first time it runs a frame has been drawn
+        self.taskMgr.add(self.firstFrame, 'First Frame', sort=55)
+
+    def firstFrame(self, task):
+        elapsed = time.time() - launched
+        print 'First frame after %.3fs' % elapsed
+        if startupReportFile.getValue():
+            with open(startupReportFile.getValue(), 'a') as reportFile:
+                reportFile.write(json.dumps({'firstFrame': elapsed, 'firstFrameAt': time.time()}) + '\n')
+        if startupExit.getValue():
+            self.quit()
+        self.taskMgr.add(self.warmUp, 'Warm Up')
+        return task.done
+
+    def warmUp(self, task):
+        # Import the lobby and round one module a frame while the user types,
+        # then start loading the round assets
+        if self.warmupQueue:
+            importlib.import_module(self.warmupQueue.pop(0))
+            return task.cont
+        from assets import loadTextureInBackground
+        from preload import Preloader
+        # the texture pool keeps the lobby background once it has been read
+        loadTextureInBackground(self, 'media/gui/mainmenu/menu.png', lambda texture: None)
+        self.preloader = Preloader(self)
+        return task.done
+
     def goToLobby(self):
+        from lobby import Lobby
+        self.taskMgr.remove('Warm Up')
         self.start.cleanup()
         self.start = None
         self.lobby = Lobby(self)
         self.lobby.show()
 
     def startRound(self):
+        from round import Round
         self.lobby.hide()
         self.round = Round(self)
 
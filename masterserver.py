@@ -0,0 +1,79 @@
+from direct.showbase.ShowBase import ShowBase
+from panda3d.core import loadPrcFileData
+
+from log import getLogger
+from matchmaking import MatchQueue, ServerEntry, makeTicket, masterPort, masterSecret, pickServer
+from server import Server
+
+loadPrcFileData(
+    "",
+    """
+        window-type none
+        audio-library-name null
+    """
+)
+
+log = getLogger('master')
+
+
+# MasterServer Class
+# Game servers register here and report their load, players queue here for
+# a match and are sent to the least loaded game server with a join ticket.
+class MasterServer(ShowBase):
+    def __init__(self):
+        if not masterSecret.getValue():
+            raise ValueError('master-secret has to be set, game servers check join tickets against it')
+        ShowBase.__init__(self)
+
+        self.server = Server(masterPort.getValue(), compress=True)
+        self.server.handleLostConnection = self.handleLostConnection
+
+        self.servers = {}
+        self.queue = MatchQueue()
+
+        self.taskMgr.add(self.masterLoop, 'Master Loop')
+
+    def handleLostConnection(self, connection):
+        server = self.servers.pop(connection, None)
+        if server:
+            log.info('game server %s went away', server.address())
+        self.queue.remove(connection)
+
+    def masterLoop(self, task):
+        for connection, package in self.server.getData():
+            if package is None or len(package) != 2:
+                continue
+            if package[0] == 'register':
+                host, port, capacity = package[1]
+                self.servers[connection] = ServerEntry(connection, host, port, capacity)
+                self.server.sendData(('registered', '%s:%d' % (host, port)), connection)
+                log.info('game server %s:%d registered, room for %d', host, port, capacity)
+            elif package[0] == 'load':
+                server = self.servers.get(connection)
+                if server:
+                    server.report(*package[1])
+            elif package[0] == 'match':
+                position = self.queue.add(connection, package[1])
+                self.server.sendData(('queued', position), connection)
+                log.info('%s queued for a match', package[1])
+        self.makeMatches()
+        return task.cont
+
+    def makeMatches(self):
+        while True:
+            count = self.queue.nextMatch()
+            if not count:
+                return
+            server = pickServer(self.servers.values(), count)
+            if server is None:
+                # everyone keeps their place until a server has room
+                return
+            server.pending += count
+            for connection, name, queued in self.queue.take(count):
+                ticket = makeTicket(name, server.address())
+                self.server.sendData(('ticket', (server.host, server.port, ticket)), connection)
+            log.info('sent a match of %d to %s', count, server.address())
+
+
+masterServer = MasterServer()
+masterServer.run()
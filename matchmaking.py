@@ -0,0 +1,116 @@
+import hashlib
+import hmac
+import time
+from collections import deque
+
+from panda3d.core import ConfigVariableDouble, ConfigVariableInt, ConfigVariableString
+
+# game servers register with, and clients find matches through, this host
+masterServer = ConfigVariableString('master-server', '')
+masterPort = ConfigVariableInt('master-port', 9098)
+# shared by the master and its game servers, join tickets are signed with it
+masterSecret = ConfigVariableString('master-secret', '')
+ticketLifetime = ConfigVariableDouble('ticket-lifetime', 60.0)
+# players per match, and how long the first in the queue waits for a full one
+matchSize = ConfigVariableInt('match-size', 4)
+matchWait = ConfigVariableDouble('match-wait', 15.0)
+# game servers that have not reported for this long are not routed to
+serverTimeout = ConfigVariableDouble('server-timeout', 10.0)
+# overrun rate above which a game server is only used when nothing else has room
+overrunLimit = ConfigVariableDouble('overrun-limit', 0.05)
+
+
+# Join tickets. The master hands a player (expiry, signature) for one game
+# server, that server checks the signature against the same secret. Anyone
+# could sign with an empty secret, so none are made or accepted without one.
+def signTicket(name, address, expiry):
+    if not masterSecret.getValue():
+        raise ValueError('master-secret is not set, join tickets cannot be signed')
+    message = '%s|%s|%d' % (name, address, expiry)
+    return hmac.new(masterSecret.getValue(), message, hashlib.sha256).hexdigest()
+
+
+def makeTicket(name, address):
+    expiry = int(time.time() + ticketLifetime.getValue())
+    return expiry, signTicket(name, address, expiry)
+
+
+def checkTicket(name, address, ticket):
+    expiry, signature = ticket
+    if not masterSecret.getValue() or expiry < time.time():
+        return False
+    return hmac.compare_digest(signTicket(name, address, expiry), signature)
+
+
+# ServerEntry Class
+# What the master knows about one registered game server.
+class ServerEntry(object):
+    def __init__(self, connection, host, port, capacity):
+        self.connection = connection
+        self.host = host
+        self.port = port
+        self.capacity = capacity
+        self.players = 0
+        self.inRound = False
+        self.overrunRate = 0.0
+        # players sent here since the last report
+        self.pending = 0
+        self.reported = time.time()
+
+    def address(self):
+        return '%s:%d' % (self.host, self.port)
+
+    def report(self, players, inRound, overrunRate):
+        self.players = players
+        self.inRound = inRound
+        self.overrunRate = overrunRate
+        self.pending = 0
+        self.reported = time.time()
+
+    def room(self):
+        return self.capacity - self.players - self.pending
+
+    def rank(self):
+        # Lower is better: servers between rounds, then ones keeping up with
+        # their ticks, then the least full
+        return self.inRound, self.overrunRate > overrunLimit.getValue(), float(self.players + self.pending) / self.capacity
+
+
+# MatchQueue Class
+# Players waiting for a match, first come first served. A match is made as
+# soon as match-size players are waiting, or with whoever is waiting once the
+# first of them has waited match-wait seconds.
+class MatchQueue(object):
+    def __init__(self):
+        self.waiting = deque()
+
+    def add(self, connection, name):
+        self.waiting.append((connection, name, time.time()))
+        return len(self.waiting)
+
+    def remove(self, connection):
+        self.waiting = deque(entry for entry in self.waiting if entry[0] != connection)
+
+    def nextMatch(self):
+        # Returns the size of the match to make now, or 0
+        if not self.waiting:
+            return 0
+        size = matchSize.getValue()
+        if len(self.waiting) >= size:
+            return size
+        if time.time() - self.waiting[0][2] >= matchWait.getValue():
+            return len(self.waiting)
+        return 0
+
+    def take(self, count):
+        return [self.waiting.popleft() for i in range(count)]
+
+
+def pickServer(servers, players):
+    # Least loaded live server with room for every player of the match
+    now = time.time()
+    candidates = [server for server in servers
+                  if server.room() >= players and now - server.reported < serverTimeout.getValue()]
+    if not candidates:
+        return None
+    return min(candidates, key=ServerEntry.rank)
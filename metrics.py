@@ -0,0 +1,56 @@
+import socket
+import threading
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+from panda3d.core import ConfigVariableInt
+
+from log import getLogger
+
+log = getLogger('metrics')
+
+# port of the local metrics endpoint, 0 disables it
+metricsPort = ConfigVariableInt('metrics-port', 9100)
+
+
+# MetricsServer Class
+# Serves the tick profiler in Prometheus text format on localhost from a
+# background thread.
+class MetricsServer(object):
+    def __init__(self, profiler, port=None):
+        self.profiler = profiler
+        self.port = metricsPort.getValue() if port is None else port
+        self.httpServer = None
+        if not self.port:
+            return
+
+        profilerRef = profiler
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = profilerRef.prometheusText()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            self.httpServer = HTTPServer(('127.0.0.1', self.port), MetricsHandler)
+        except socket.error as error:
+            # eg. another game server on this host already has the port
+            log.warning('no metrics endpoint, could not listen on port %d: %s', self.port, error)
+            return
+        self.thread = threading.Thread(target=self.httpServer.serve_forever, name='Metrics Server')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def destroy(self):
+        if self.httpServer:
+            self.httpServer.shutdown()
+            self.httpServer = None
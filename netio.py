@@ -0,0 +1,102 @@
+import Queue
+import collections
+import threading
+import time
+
+from direct.distributed.PyDatagramIterator import PyDatagramIterator
+from panda3d.core import ConfigVariableDouble, ConfigVariableInt, NetDatagram
+
+import rencode
+from capture import decodeMeasured
+
+netIoThreads = ConfigVariableInt('net-io-threads', 0,
+                                 'Threads for the connection reader and writer, 0 reads and writes sockets in the '
+                                 'main loop')
+netDecodeThreads = ConfigVariableInt('net-decode-threads', 2,
+                                     'Worker threads decompressing and decoding messages when net-io-threads is set')
+netPollInterval = ConfigVariableDouble('net-poll-interval', 0.001,
+                                       'Seconds the reader pump first sleeps when no datagram is waiting, doubled '
+                                       'every empty poll up to net-poll-max-interval')
+netPollMaxInterval = ConfigVariableDouble('net-poll-max-interval', 0.01,
+                                          'Longest the reader pump sleeps between polls while the connection is idle')
+
+
+# DecodePipeline Class
+# Pulls datagrams off a threaded QueuedConnectionReader and decompresses and
+# decodes them on worker threads. Results come back through a deque (a single
+# atomic append, no lock) and getData releases them in the order they were
+# read, so the per connection ordering the lockstep ticks rely on is kept.
+class DecodePipeline(object):
+    def __init__(self, reader, workers, measure=False):
+        self.reader = reader
+        # also hand back raw size and codec time for the traffic capture
+        self.measure = measure
+
+        self.work = Queue.Queue()
+        self.done = collections.deque()
+        # decoded messages waiting on an earlier one to finish
+        self.pending = {}
+        self.nextSequence = 0
+
+        self.running = True
+        self.workers = [threading.Thread(target=self.decode, name='Net Decoder %d' % i)
+                        for i in range(max(workers, 1))]
+        self.threads = [threading.Thread(target=self.pump, name='Net Reader')] + self.workers
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def pump(self):
+        # The queued reader cannot be waited on, so the pump polls it. The
+        # sleep backs off while nothing arrives, so an idle connection does
+        # not keep taking the GIL from the main thread, and drops back as
+        # soon as a datagram comes in.
+        sequence = 0
+        interval = netPollInterval.getValue()
+        while self.running:
+            if not self.reader.dataAvailable():
+                time.sleep(interval)
+                interval = min(interval * 2, netPollMaxInterval.getValue())
+                continue
+            interval = netPollInterval.getValue()
+            datagram = NetDatagram()
+            if self.reader.getData(datagram):
+                wire = PyDatagramIterator(datagram).getString()
+                self.work.put((sequence, datagram.getConnection(), wire))
+                sequence += 1
+
+    def decode(self):
+        while True:
+            item = self.work.get()
+            if item is None:
+                return
+            sequence, connection, wire = item
+            try:
+                if self.measure:
+                    data, rawSize, codecTime = decodeMeasured(wire)
+                else:
+                    data, rawSize, codecTime = rencode.loads(wire), len(wire), 0.0
+            except Exception:
+                # the sequence number still has to be handed back or every
+                # later message would wait on it forever
+                data, rawSize, codecTime = None, len(wire), 0.0
+            self.done.append((sequence, (connection, data, rawSize, wire, codecTime)))
+
+    def getData(self):
+        # Return (connection, data, raw size, wire, codec seconds) for every
+        # message decoded so far, in the order they were read
+        while self.done:
+            sequence, entry = self.done.popleft()
+            self.pending[sequence] = entry
+        ready = []
+        while self.nextSequence in self.pending:
+            entry = self.pending.pop(self.nextSequence)
+            self.nextSequence += 1
+            if entry[1] is not None:
+                ready.append(entry)
+        return ready
+
+    def destroy(self):
+        self.running = False
+        for worker in self.workers:
+            self.work.put(None)
@@ -0,0 +1,159 @@
+import atexit
+import collections
+import sqlite3
+import threading
+
+from panda3d.core import ConfigVariableDouble, ConfigVariableInt, ConfigVariableString
+
+from log import getLogger
+
+log = getLogger('persistence')
+
+# sqlite file match results are kept in, empty to keep nothing
+statsDatabase = ConfigVariableString('stats-database', 'stats.db')
+statsFlushInterval = ConfigVariableDouble('stats-flush-interval', 1.0)
+# most queued writes committed in one transaction
+statsBatchSize = ConfigVariableInt('stats-batch-size', 256)
+
+schema = """
+CREATE TABLE IF NOT EXISTS matches (
+    id INTEGER PRIMARY KEY,
+    server TEXT,
+    started REAL,
+    ended REAL,
+    ticks INTEGER,
+    winner TEXT
+);
+CREATE TABLE IF NOT EXISTS results (
+    match INTEGER REFERENCES matches(id),
+    player TEXT,
+    kills INTEGER,
+    deaths INTEGER,
+    food INTEGER,
+    maxLength INTEGER
+);
+CREATE INDEX IF NOT EXISTS resultsByPlayer ON results (player);
+CREATE INDEX IF NOT EXISTS resultsByMatch ON results (match);
+CREATE TABLE IF NOT EXISTS players (
+    name TEXT PRIMARY KEY,
+    matches INTEGER DEFAULT 0,
+    wins INTEGER DEFAULT 0,
+    kills INTEGER DEFAULT 0,
+    deaths INTEGER DEFAULT 0,
+    food INTEGER DEFAULT 0,
+    maxLength INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS playersByWins ON players (wins);
+CREATE INDEX IF NOT EXISTS playersByKills ON players (kills);
+CREATE INDEX IF NOT EXISTS playersByFood ON players (food);
+CREATE INDEX IF NOT EXISTS playersByMaxLength ON players (maxLength);
+CREATE INDEX IF NOT EXISTS matchesByEnded ON matches (ended);
+"""
+
+# columns of the players table a leaderboard can be ordered by
+leaderboardStats = ('matches', 'wins', 'kills', 'deaths', 'food', 'maxLength')
+
+
+# StatsStore Class
+# Write-behind store for match results. recordMatch only appends to a deque
+# (a single atomic append, no lock) and returns, a background thread owns the
+# write connection and commits whatever has queued up in batched
+# transactions. Reads use their own connection per thread.
+class StatsStore(object):
+    def __init__(self, path):
+        self.path = path
+        self.pending = collections.deque()
+        self.wake = threading.Event()
+        self.running = True
+        self.readers = threading.local()
+
+        # the schema has to exist before anyone reads
+        connection = sqlite3.connect(self.path)
+        connection.executescript(schema)
+        connection.close()
+
+        self.thread = threading.Thread(target=self.run, name='Stats Writer')
+        self.thread.daemon = True
+        self.thread.start()
+        atexit.register(self.close)
+
+    def recordMatch(self, server, started, ended, ticks, winner, results):
+        # results are (name, kills, deaths, food, max length) per player
+        self.pending.append((server, started, ended, ticks, winner, tuple(results)))
+
+    def run(self):
+        connection = sqlite3.connect(self.path)
+        while self.running:
+            self.wake.wait(statsFlushInterval.getValue())
+            self.wake.clear()
+            self.flush(connection)
+        self.flush(connection)
+        connection.close()
+
+    def flush(self, connection):
+        while self.pending:
+            batch = []
+            while self.pending and len(batch) < statsBatchSize.getValue():
+                batch.append(self.pending.popleft())
+            try:
+                with connection:
+                    for match in batch:
+                        self.writeMatch(connection, match)
+            except sqlite3.Error as error:
+                log.error('could not store %d matches: %s', len(batch), error)
+
+    def writeMatch(self, connection, match):
+        server, started, ended, ticks, winner, results = match
+        cursor = connection.execute('INSERT INTO matches (server, started, ended, ticks, winner) VALUES (?, ?, ?, ?, ?)',
+                                    (server, started, ended, ticks, winner))
+        matchId = cursor.lastrowid
+        connection.executemany('INSERT INTO results VALUES (?, ?, ?, ?, ?, ?)',
+                               [(matchId,) + tuple(result) for result in results])
+        connection.executemany('INSERT OR IGNORE INTO players (name) VALUES (?)',
+                               [(result[0],) for result in results])
+        connection.executemany('UPDATE players SET matches = matches + 1, wins = wins + ?, kills = kills + ?, '
+                               'deaths = deaths + ?, food = food + ?, maxLength = MAX(maxLength, ?) WHERE name = ?',
+                               [(int(name == winner), kills, deaths, food, maxLength, name)
+                                for name, kills, deaths, food, maxLength in results])
+
+    def close(self):
+        if not self.running:
+            return
+        self.running = False
+        self.wake.set()
+        self.thread.join()
+
+    def reader(self):
+        connection = getattr(self.readers, 'connection', None)
+        if connection is None:
+            connection = self.readers.connection = sqlite3.connect(self.path)
+        return connection
+
+    def leaderboard(self, stat='wins', limit=10):
+        # [(name, value)] of the best players by one of leaderboardStats
+        if stat not in leaderboardStats:
+            raise ValueError('no leaderboard for %s' % stat)
+        return self.reader().execute('SELECT name, %s FROM players ORDER BY %s DESC LIMIT ?' % (stat, stat),
+                                     (limit,)).fetchall()
+
+    def playerStats(self, name):
+        # (matches, wins, kills, deaths, food, max length) or None
+        return self.reader().execute('SELECT %s FROM players WHERE name = ?' % ', '.join(leaderboardStats),
+                                     (name,)).fetchone()
+
+    def playerHistory(self, name, limit=10):
+        # Latest results of a player as (ended, kills, deaths, food, max length, winner)
+        return self.reader().execute('SELECT matches.ended, kills, deaths, food, maxLength, winner FROM results '
+                                     'JOIN matches ON matches.id = results.match WHERE player = ? '
+                                     'ORDER BY matches.ended DESC LIMIT ?', (name, limit)).fetchall()
+
+    def recentMatches(self, limit=10):
+        return self.reader().execute('SELECT id, server, started, ended, ticks, winner FROM matches '
+                                     'ORDER BY ended DESC LIMIT ?', (limit,)).fetchall()
+
+
+def getStatsStore():
+    # The store named by stats-database, or None when results are not kept
+    if not statsDatabase.getValue():
+        return None
+    return StatsStore(statsDatabase.getValue())
@@ -0,0 +1,72 @@
+import threading
+from collections import deque
+
+from assets import modelPath
+
+# Every model a round needs, with whether it is cached flattened
+roundAssets = [
+    ('models/arena', True),
+    ('models/centipede', False),
+    ('models/ring', False),
+    ('panda-model', False),
+    ('models/panda-walk4', False),
+]
+
+
+# Preloader Class
+# Loads the round assets in the background so that building a Game later only
+# hits the model pool. The assets are resolved through the asset cache on a
+# thread, which is where a cold cache converts them, and every resolved path
+# is then loaded asynchronously by the Panda loader.
+class Preloader(object):
+    def __init__(self, showbase, progressHandler=None, assets=roundAssets):
+        self.showbase = showbase
+        self.progressHandler = progressHandler
+        self.total = len(assets)
+        self.loaded = 0
+        self.models = []
+        # cache paths handed over by the resolver thread
+        self.resolved = deque()
+        self.issued = 0
+
+        self.running = True
+        self.thread = threading.Thread(target=self.resolve, args=(list(assets),), name='Asset Resolver')
+        self.thread.daemon = True
+        self.thread.start()
+
+        self.showbase.taskMgr.add(self.preloadTask, 'Preload Assets')
+
+    def done(self):
+        return self.loaded == self.total
+
+    def progress(self):
+        if not self.total:
+            return 1.0
+        return float(self.loaded) / self.total
+
+    def resolve(self, assets):
+        for path, flatten in assets:
+            if not self.running:
+                return
+            self.resolved.append(modelPath(path, flatten))
+
+    def preloadTask(self, task):
+        while self.resolved:
+            # the loader keeps the model in its pool, later loads are instant
+            self.showbase.loader.loadModel(self.resolved.popleft(), callback=self.assetLoaded)
+            self.issued += 1
+        if self.issued == self.total:
+            return task.done
+        return task.cont
+
+    def assetLoaded(self, model):
+        # hold on to the model so that the pool entry stays alive
+        self.models.append(model)
+        self.loaded += 1
+        if self.progressHandler:
+            self.progressHandler(self.progress())
+
+    def destroy(self):
+        self.running = False
+        self.showbase.taskMgr.remove('Preload Assets')
+        self.models = []
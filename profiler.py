@@ -0,0 +1,190 @@
+import json
+import time
+from timeit import default_timer
+
+from panda3d.core import ConfigVariableBool, ConfigVariableString, PStatCollector
+
+tickProfiler = ConfigVariableBool('tick-profiler', True)
+tickProfilerPStats = ConfigVariableBool('tick-profiler-pstats', False)
+tickSummaryFile = ConfigVariableString('tick-summary-file', 'tick-summary.log')
+
+
+# Histogram Class
+# Log linear buckets in microseconds, like HdrHistogram: every power of two is
+# split into subBuckets linear buckets, so the relative error stays constant
+# from microsecond phases to multi frame hitches.
+class Histogram(object):
+    subBits = 5
+    subBuckets = 1 << subBits
+    maxPower = 24
+
+    def __init__(self):
+        self.counts = [0] * (self.subBuckets * (self.maxPower + 1))
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def bucketOf(self, micros):
+        value = int(micros)
+        if value < self.subBuckets:
+            return value
+        power = value.bit_length() - self.subBits - 1
+        index = (power + 1) * self.subBuckets + (value >> power) - self.subBuckets
+        return min(index, len(self.counts) - 1)
+
+    def bucketValue(self, index):
+        # upper bound of a bucket, in microseconds
+        if index < self.subBuckets:
+            return index + 1
+        power = index // self.subBuckets - 1
+        return ((index % self.subBuckets) + self.subBuckets + 1) << power
+
+    def record(self, seconds):
+        micros = seconds * 1000000.0
+        self.counts[self.bucketOf(micros)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, fraction):
+        if not self.count:
+            return 0.0
+        target = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return self.bucketValue(index) / 1000000.0
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def buckets(self):
+        # cumulative counts for every non empty bucket, in seconds
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count:
+                seen += count
+                yield self.bucketValue(index) / 1000000.0, seen
+
+
+# TickProfiler Class
+# Times the phases of the server tick. Each phase keeps a histogram for the
+# life of the process (exported as metrics) and one for the current round
+# (written as a summary at game over).
+class TickProfiler(object):
+    def __init__(self, budget=1.0 / 30.0):
+        self.enabled = tickProfiler.getValue()
+        self.pstats = tickProfilerPStats.getValue()
+        self.budget = budget
+
+        self.phases = {}
+        self.roundPhases = {}
+        self.collectors = {}
+        self.counters = {'ticks': 0, 'overruns': 0}
+        self.gauges = {}
+        self.roundStart = time.time()
+
+    def start(self, phase=None):
+        if not self.enabled:
+            return 0.0
+        if self.pstats and phase:
+            self.collector(phase).start()
+        return default_timer()
+
+    def stop(self, phase, started):
+        if not self.enabled:
+            return
+        elapsed = default_timer() - started
+        histogram = self.phases.get(phase)
+        if histogram is None:
+            histogram = self.phases[phase] = Histogram()
+            self.roundPhases[phase] = Histogram()
+        histogram.record(elapsed)
+        self.roundPhases[phase].record(elapsed)
+        if self.pstats:
+            self.collector(phase).stop()
+        return elapsed
+
+    def collector(self, phase):
+        collector = self.collectors.get(phase)
+        if collector is None:
+            collector = self.collectors[phase] = PStatCollector('Tick:' + phase)
+        return collector
+
+    def tickDone(self, started):
+        # Record a whole tick and whether it ran over its time budget
+        elapsed = self.stop('tick', started)
+        if elapsed is None:
+            return
+        self.counters['ticks'] += 1
+        if elapsed > self.budget:
+            self.counters['overruns'] += 1
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def gauge(self, name, value):
+        if self.enabled:
+            self.gauges[name] = value
+
+    def overrunRate(self):
+        ticks = self.counters['ticks']
+        return float(self.counters['overruns']) / ticks if ticks else 0.0
+
+    def prometheusText(self):
+        lines = []
+        for phase in sorted(self.phases):
+            histogram = self.phases[phase]
+            name = 'centipede_phase_seconds'
+            for bound, seen in histogram.buckets():
+                lines.append('%s_bucket{phase="%s",le="%g"} %d' % (name, phase, bound, seen))
+            lines.append('%s_bucket{phase="%s",le="+Inf"} %d' % (name, phase, histogram.count))
+            lines.append('%s_sum{phase="%s"} %f' % (name, phase, histogram.total))
+            lines.append('%s_count{phase="%s"} %d' % (name, phase, histogram.count))
+        for counter in sorted(self.counters):
+            lines.append('centipede_%s_total %d' % (counter, self.counters[counter]))
+        for gauge in sorted(self.gauges):
+            lines.append('centipede_%s %g' % (gauge, self.gauges[gauge]))
+        return '\n'.join(lines) + '\n'
+
+    def roundSummary(self):
+        summary = {'duration': time.time() - self.roundStart, 'phases': {}}
+        for phase, histogram in self.roundPhases.items():
+            summary['phases'][phase] = {
+                'count': histogram.count,
+                'mean': histogram.mean(),
+                'p50': histogram.percentile(0.5),
+                'p99': histogram.percentile(0.99),
+                'max': histogram.max,
+            }
+        summary['counters'] = dict(self.counters)
+        summary['gauges'] = dict(self.gauges)
+        return summary
+
+    def writeRoundSummary(self):
+        # Append the finished round to the summary file and start a new one
+        if not self.enabled:
+            return
+        if tickSummaryFile.getValue():
+            with open(tickSummaryFile.getValue(), 'a') as summaryFile:
+                summaryFile.write(json.dumps(self.roundSummary(), sort_keys=True) + '\n')
+        self.resetRound()
+
+    def resetRound(self):
+        for phase in self.roundPhases:
+            self.roundPhases[phase] = Histogram()
+        self.roundStart = time.time()
+
+
+profiler = None
+
+
+def getProfiler():
+    global profiler
+    if profiler is None:
+        profiler = TickProfiler()
+    return profiler
@@ -1,12 +1,16 @@
 from collections import deque
 
 from direct.showbase.DirectObject import DirectObject
+from panda3d.core import ConfigVariableInt
 
 from game import Game
+from gccontrol import GcController
 from gamehandler import GameHandler
+from simthread import SimulationThread, clientSimThread
 from userdata import UserData
 
-gameTick = 1.0 / 30.0
+# ticks queued beyond this many bundles worth are run straight away
+interpolationBuffer = ConfigVariableInt('interpolation-buffer', 2)
 
 
 class Round(DirectObject):
@@ -20,77 +24,178 @@ class Round(DirectObject):
         # total time since start of game, to keep ticks updating on time (rather, not before)
         self.totalTime = 0
 
+        # packets received, waiting for the playout to queue them
+        self.inbox = deque()
         # packets queue
         self.incoming = deque()
 
+        # a round joined mid way is only played by the players it started with
+        snapshot = self.showbase.snapshot
+        self.showbase.snapshot = None
+        players = self.showbase.users
+        if snapshot:
+            players = [self.showbase.usersByName[name] for name in snapshot[0]]
+
         users = []
         for user in self.showbase.users:
+            user.gameData = None
+        for user in players:
             user.gameData = UserData(user.name == self.showbase.username)
             users.append(user.gameData)
-        self.game = Game(self.showbase, users, self.showbase.gameData)
+        # the match scene is kept between rounds and reset in place
+        if self.showbase.game:
+            self.game = self.showbase.game
+            self.game.startRound(users, self.showbase.gameData)
+        else:
+            self.game = Game(self.showbase, users, self.showbase.gameData)
+            self.showbase.game = self.game
         self.gameHandler = GameHandler(self.showbase, self.game)
 
         self.tick = 0
         self.tempTick = 0
 
+        # Ticks are played out at the simulation rate, whatever rate they
+        # arrive at, and drawn blended between the last two
+        self.gameTick = 1.0 / self.showbase.gameData.tickRate
+        # time since the last tick ran
+        self.tickTime = 0.0
+        self.bufferedTicks = 0
+        # ticks in the last bundle, tells how far apart bundles arrive
+        self.bundleTicks = 1
+        if snapshot:
+            # carry on from the server's state, the ticks queued up since are
+            # run back to back until the playout buffer is back to normal
+            self.tempTick = self.game.applySnapshot(snapshot[1]) - 1
+
         # Set event handlers for keys
         # self.showbase.accept("escape", sys.exit)
 
+        # the cyclic collector only runs in the slack between ticks
+        self.gcController = GcController(self.game.profiler)
+        self.gcController.startRound()
+
+        # ticks are played out either here or on a thread of their own, the
+        # game loop then only draws what that thread publishes
+        self.simulation = None
+        if clientSimThread.getValue():
+            self.simulation = SimulationThread(self)
+
         # send loading completion packet to the game server
         self.showbase.client.sendData(('round', 'sync'))
 
         # Add the game loop procedure to the task manager.
         self.showbase.taskMgr.add(self.gameLoop, 'Game Loop')
+        if self.simulation:
+            self.simulation.start()
 
     def destroy(self):
         self.showbase.taskMgr.remove('Game Loop')
-        self.game.destroy()
+        if self.simulation:
+            self.simulation.stop()
+        self.gcController.endRound()
+        self.game.endRound()
         self.gameHandler.destroy()
 
-    # Game Loop Procedure
-    def gameLoop(self, task):
-        dt = task.getDt()
+    def receivePackets(self, packets):
+        for packet in packets:
+            if len(packet) == 2 and packet[0] == 'ping':
+                # answered straight away, the server measures round trips
+                self.showbase.client.sendData(('pong', packet[1]))
+            else:
+                self.inbox.append(packet)
+        if packets and self.simulation:
+            self.simulation.notify()
+
+    def queuePackets(self):
+        while self.inbox:
+            packet = self.inbox.popleft()
+            if len(packet) == 2 and packet[0] == 'bundle':
+                ticks = 0
+                for message in packet[1]:
+                    self.incoming.append(message)
+                    if message[0] == 'tick':
+                        ticks += 1
+                self.bufferedTicks += ticks
+                if ticks:
+                    self.bundleTicks = ticks
+            else:
+                self.incoming.append(packet)
+                if len(packet) == 2 and packet[0] == 'tick':
+                    self.bufferedTicks += 1
+
+    def processPackage(self, package):
+        # Returns False once the round is over
+        if len(package) == 2:
+            if package[0] == 'tick':
+                # not sure if this is the best way to do this but yea something to look into for syncing them all preround i guess
+                if package[1] == 0:
+                    self.totalTime = 0
+                # check what tick it should be
+                self.tempTick = package[1]
+                # run tick, the round only ends when the server says so: a
+                # copy that drifted could otherwise end it here alone
+                self.game.runTick(self.gameTick, self.tempTick)
+            elif package[0] == "game" and package[1] == "over":
+                print 'Game Over'
+                return False
+            elif package[0] == 'foods':
+                self.game.applyFoodStates(package[1])
+            else:
+                user = self.showbase.usersByName.get(package[0])
+                if user and user.gameData:
+                    user.gameData.processUpdatePacket(package[1])
+        return True
+
+    def advance(self, dt):
+        # Play out the ticks that are due, returns False once the round is over
         # update total time
         self.totalTime += dt
         # process any incoming network packets
-        temp = self.showbase.client.getData()
-        for packet in temp:
-            # this part puts the next packets onto the end of the queue
-            self.incoming.append(packet)
+        self.queuePackets()
 
+        self.tickTime += dt
         # while there is packets to process
         while len(self.incoming):
-            package = self.incoming.popleft()
-            if len(package) == 2:
-                # if username is sent, assign to client
-                if package[0] == 'tick':
-                    # not sure if this is the best way to do this but yea something to look into for syncing them all preround i guess
-                    if package[1] == 0:
-                        self.totalTime = 0
-                    # check what tick it should be
-                    self.tempTick = package[1]
-                    # if this tick needs to be run (if frames are up to the server tick)
-                    # if self.temp_tick * game_tick <= self.total_time:
-                    # run tick
-                    if not self.game.runTick(gameTick, self.tempTick):
-                        print 'Game Over'
-                        self.showbase.endRound()
-                        return task.done
-                        # else:
-                        # otherwise put packet back on front of list and end frame processing
-                        #	self.incoming.appendleft(package)
-                        #	break
-                elif package[0] == "game" and package[1] == "over":
-                    print 'Game Over'
-                    self.showbase.endRound()
-                    return task.done
-                else:
-                    for user in self.showbase.users:
-                        if user.name == package[0]:
-                            user.gameData.processUpdatePacket(package[1])
+            package = self.incoming[0]
+            if len(package) == 2 and package[0] == 'tick':
+                # the next tick waits for its time, unless ticks are piling up
+                behind = self.bufferedTicks > self.bundleTicks * interpolationBuffer.getValue()
+                if self.tickTime < self.gameTick and not behind:
+                    break
+                self.tickTime = max(self.tickTime - self.gameTick, 0.0)
+                self.bufferedTicks -= 1
+            self.incoming.popleft()
+            if not self.processPackage(package):
+                return False
+        if not self.bufferedTicks:
+            # starved, hold on the last tick instead of running ahead later
+            self.tickTime = min(self.tickTime, self.gameTick)
+        return True
+
+    # Game Loop Procedure
+    def gameLoop(self, task):
+        dt = task.getDt()
+        self.receivePackets(self.showbase.client.getData())
+
+        if self.simulation:
+            if self.simulation.over:
+                self.showbase.endRound()
+                return task.done
+            # move the actors to the latest tick the simulation thread published
+            self.simulation.draw()
+        else:
+            if not self.advance(dt):
+                self.showbase.endRound()
+                return task.done
+            # move the actors to where the simulation left them
+            self.game.syncNodes(min(self.tickTime / self.gameTick, 1.0))
 
         self.gameHandler.update(dt)
 
+        if not self.simulation:
+            # collect garbage in whatever time is left before the next tick
+            self.gcController.idle(self.gameTick - self.tickTime)
+
         # TODO: Not sure if this is the best place for this
         # self.gameHandler.getUpdates()
 
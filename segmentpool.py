@@ -0,0 +1,54 @@
+from direct.actor.Actor import BitMask32
+
+from collision import getColliderShape, initCollisionSphere
+
+
+# SegmentPool Class
+# Keeps centipede body segments alive between uses so that eating food does
+# not load a new Actor or compute its bounds. Allocated at round start and
+# grown in batches when it runs dry. Every segment collides with the same
+# sphere, so the simulation only needs the shape and never a segment.
+class SegmentPool(object):
+    def __init__(self, parent, animation, size, batch=8, showSpheres=False):
+        self.parent = parent
+        self.batch = batch
+        self.animation = animation
+        self.model = animation.model
+        self.showSpheres = showSpheres
+
+        self.segments = []
+        self.free = []
+
+        # at least one segment is loaded to read the shape from
+        self.grow(max(size, 1))
+        self.shape = getColliderShape(self.segments[0].collisionNode[0])
+
+    def grow(self, count):
+        for i in range(count):
+            # Load centipede model, spreading segments over the walk phases
+            node = self.animation.make('Body', len(self.segments))
+
+            node.collisionNode = initCollisionSphere(node, 'Body', 0.65, 0, BitMask32(0x0), model=self.model)
+            if self.showSpheres:
+                node.collisionNode[0].show()
+
+            self.segments.append(node)
+            self.free.append(node)
+
+    def acquire(self):
+        if not self.free:
+            self.grow(self.batch)
+        node = self.free.pop()
+        # Reparent the model to render.
+        node.reparentTo(self.parent)
+        return node
+
+    def release(self, node):
+        node.detachNode()
+        self.free.append(node)
+
+    def destroy(self):
+        for node in self.segments:
+            self.animation.release(node)
+        self.segments = []
+        self.free = []
@@ -0,0 +1,55 @@
+from panda3d.core import ConfigVariableDouble
+
+# highest and lowest rate, per second, updates are sent to one client at
+sendRateMax = ConfigVariableDouble('send-rate', 30.0)
+sendRateMin = ConfigVariableDouble('send-rate-min', 10.0)
+# seconds between round trip time measurements
+pingInterval = ConfigVariableDouble('ping-interval', 1.0)
+# round trip time above the lowest seen that is taken as a queue building up
+congestionDelay = ConfigVariableDouble('send-rate-congestion-delay', 0.05)
+
+
+# SendQueue Class
+# Everything a client is sent during a round goes through its queue and is
+# flushed as one bundle every few ticks. Clients simulate every tick, so a
+# slower rate means fewer, larger bundles, never skipped ticks. The rate
+# backs off when the round trip time grows past the lowest one seen (the
+# connection is queueing) and creeps back up while it does not.
+class SendQueue(object):
+    def __init__(self, tickRate):
+        self.tickRate = tickRate
+        self.maxRate = min(sendRateMax.getValue(), tickRate)
+        self.minRate = min(sendRateMin.getValue(), self.maxRate)
+        self.rate = self.maxRate
+
+        self.outbox = []
+        self.ticks = 0
+
+        self.rtt = None
+        self.minRtt = None
+
+    def add(self, message):
+        self.outbox.append(message)
+
+    def interval(self):
+        # ticks between bundles
+        return max(1, int(round(self.tickRate / self.rate)))
+
+    def tickDone(self):
+        # Returns whether a bundle is due
+        self.ticks += 1
+        return self.ticks >= self.interval()
+
+    def take(self):
+        bundle = tuple(self.outbox)
+        self.outbox = []
+        self.ticks = 0
+        return bundle
+
+    def pong(self, rtt):
+        self.rtt = rtt if self.rtt is None else self.rtt * 0.75 + rtt * 0.25
+        self.minRtt = rtt if self.minRtt is None else min(self.minRtt, rtt)
+        if self.rtt - self.minRtt > congestionDelay.getValue():
+            self.rate = max(self.minRate, self.rate * 0.5)
+        else:
+            self.rate = min(self.maxRate, self.rate + 1.0)
@@ -8,6 +8,8 @@ from panda3d.core import QueuedConnectionManager, QueuedConnectionListener
 from panda3d.core import QueuedConnectionReader, ConnectionWriter
 
 import rencode
+from capture import CaptureWriter, INCOMING, OUTGOING, decodeMeasured, encodeMeasured, netCaptureFile
+from netio import DecodePipeline, netDecodeThreads, netIoThreads
 
 
 class Server(DirectObject):
@@ -23,11 +25,22 @@ class Server(DirectObject):
 
         self.cManager = QueuedConnectionManager()
         self.cListener = QueuedConnectionListener(self.cManager, 0)
-        self.cReader = QueuedConnectionReader(self.cManager, 0)
-        self.cWriter = ConnectionWriter(self.cManager, 0)
+        ioThreads = netIoThreads.getValue()
+        self.cReader = QueuedConnectionReader(self.cManager, ioThreads)
+        self.cWriter = ConnectionWriter(self.cManager, ioThreads)
 
         self.passedData = []
 
+        # optional record of all traffic for offline analysis
+        self.capture = None
+        if netCaptureFile.getValue():
+            self.capture = CaptureWriter(netCaptureFile.getValue())
+
+        # with I/O threads, messages are also decoded off the main loop
+        self.pipeline = None
+        if ioThreads:
+            self.pipeline = DecodePipeline(self.cReader, netDecodeThreads.getValue(), self.capture is not None)
+
         self.connect(port, backlog)
         self.startPolling()
 
@@ -71,6 +84,11 @@ class Server(DirectObject):
 
     def processData(self, netDatagram):
         myIterator = PyDatagramIterator(netDatagram)
+        if self.capture:
+            wire = myIterator.getString()
+            data, rawSize, codecTime = decodeMeasured(wire)
+            self.capture.record(INCOMING, netDatagram.getConnection(), rawSize, wire, codecTime)
+            return data
         return self.decode(myIterator.getString())
 
     def encode(self, data, compress=False):
@@ -83,15 +101,39 @@ class Server(DirectObject):
 
     def sendData(self, data, con):
         myPyDatagram = PyDatagram()
-        myPyDatagram.addString(self.encode(data, self.compress))
+        if self.capture:
+            wire, rawSize, codecTime = encodeMeasured(data, self.compress)
+            self.capture.record(OUTGOING, con, rawSize, wire, codecTime)
+            myPyDatagram.addString(wire)
+        else:
+            myPyDatagram.addString(self.encode(data, self.compress))
         self.cWriter.send(myPyDatagram, con)
 
+    def sendDataToAll(self, data, connections):
+        # encode the data once and send the same datagram to every connection
+        myPyDatagram = PyDatagram()
+        if self.capture:
+            wire, rawSize, codecTime = encodeMeasured(data, self.compress)
+            for con in connections:
+                self.capture.record(OUTGOING, con, rawSize, wire, codecTime)
+            myPyDatagram.addString(wire)
+        else:
+            myPyDatagram.addString(self.encode(data, self.compress))
+        for con in connections:
+            self.cWriter.send(myPyDatagram, con)
+
     def passData(self, data, connection):
         self.passedData.append((data, connection))
 
     def getData(self):
         data = self.passedData
         self.passedData = []
+        if self.pipeline:
+            for connection, package, rawSize, wire, codecTime in self.pipeline.getData():
+                if self.capture:
+                    self.capture.record(INCOMING, connection, rawSize, wire, codecTime)
+                data.append((connection, package))
+            return data
         while self.cReader.dataAvailable():
             datagram = NetDatagram()
             if self.cReader.getData(datagram):
@@ -0,0 +1,125 @@
+import threading
+import traceback
+from timeit import default_timer
+
+import numpy as np
+from panda3d.core import ConfigVariableBool, ConfigVariableDouble
+
+from kinematics import blendChains
+from log import getLogger
+
+log = getLogger('simthread')
+
+clientSimThread = ConfigVariableBool('client-sim-thread', False,
+                                     'Run the client simulation on its own thread, the render task only draws '
+                                     'the latest tick it published')
+simIdleWait = ConfigVariableDouble('sim-idle-wait', 0.05,
+                                   'Longest the simulation thread sleeps while it has no ticks to play out')
+
+
+# RenderState Class
+# What syncNodes draws: the chains before and after a tick, the body count of
+# every centipede and where every food is. Filled by copying, so the
+# simulation can carry on while it is drawn, or as a view of the live arrays
+# when both run on the same thread.
+class RenderState(object):
+    def __init__(self):
+        self.chains = None
+        self.counts = None
+        self.foods = []
+
+    def fill(self, kinematics, foods, copy=True):
+        chains = kinematics.getChains()
+        if not copy:
+            self.chains = chains
+            self.counts = kinematics.count
+        elif self.chains is None or self.chains[0].shape != chains[0].shape:
+            # the chain columns have grown since the last copy
+            self.chains = tuple(array.copy() for array in chains)
+            self.counts = kinematics.count.copy()
+        else:
+            for target, array in zip(self.chains, chains):
+                np.copyto(target, array)
+            np.copyto(self.counts, kinematics.count)
+        self.foods = [food.getRenderState() for food in foods]
+
+    def blend(self, alpha):
+        return blendChains(self.chains, alpha)
+
+
+# SimulationThread Class
+# Plays out a round's ticks on a thread of its own. After every tick it fills
+# the back of two RenderStates and swaps them under a lock, the render task
+# draws the front one under the same lock, so neither waits on the other for
+# longer than a swap or a draw. The round's packets are handed over through
+# Round.inbox, notify wakes the thread when some arrive.
+class SimulationThread(object):
+    def __init__(self, gameRound):
+        self.round = gameRound
+        self.game = gameRound.game
+
+        self.buffers = [RenderState(), RenderState()]
+        self.lock = threading.Lock()
+        # when the front buffer was published and how far into its tick the
+        # round was, to blend from while the next one is simulated
+        self.published = 0.0
+        self.tickTime = 0.0
+
+        self.wake = threading.Event()
+        self.running = True
+        # set once the round is over, the render task ends it
+        self.over = False
+        self.thread = threading.Thread(target=self.run, name='Simulation')
+        self.thread.daemon = True
+
+    def start(self):
+        self.publish()
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.wake.set()
+        self.thread.join()
+
+    def notify(self):
+        self.wake.set()
+
+    def run(self):
+        gameRound = self.round
+        last = default_timer()
+        while self.running:
+            self.wake.clear()
+            now = default_timer()
+            tick = gameRound.tempTick
+            try:
+                playing = gameRound.advance(now - last)
+            except Exception:
+                log.error('simulation failed at tick %d\n%s', gameRound.tempTick, traceback.format_exc())
+                playing = False
+            last = now
+            if not playing:
+                self.over = True
+                return
+            if gameRound.tempTick != tick:
+                self.publish()
+            # collect garbage in whatever time is left before the next tick
+            gameRound.gcController.idle(gameRound.gameTick - gameRound.tickTime)
+            if gameRound.bufferedTicks:
+                self.wake.wait(max(gameRound.gameTick - gameRound.tickTime, 0.0))
+            else:
+                self.wake.wait(simIdleWait.getValue())
+
+    def publish(self):
+        # Fill the back buffer while the front one may be being drawn
+        self.game.captureState(self.buffers[1])
+        with self.lock:
+            self.buffers.reverse()
+            self.published = default_timer()
+            self.tickTime = self.round.tickTime
+
+    def draw(self):
+        # Move the actors to the latest published tick, blended on by the time
+        # since it was published
+        with self.lock:
+            elapsed = self.tickTime + default_timer() - self.published
+            self.game.syncNodes(min(elapsed / self.round.gameTick, 1.0), self.buffers[0])
@@ -0,0 +1,58 @@
+import math
+
+
+# SpatialHash Class
+# Uniform grid over the square arena. Items are bucketed by the cell their
+# position falls in and only re-bucketed when they cross into another cell.
+class SpatialHash(object):
+    def __init__(self, cellSize=8.0, extent=125.0):
+        self.extent = float(extent)
+        self.resize(cellSize)
+
+    def resize(self, cellSize):
+        # Changing the cell size empties the grid, items are re-added on move
+        self.cellSize = float(cellSize)
+        # number of cells along each axis, positions outside are clamped
+        self.size = int(math.ceil(2 * self.extent / self.cellSize))
+        self.clear()
+
+    def cellOf(self, x, y):
+        i = int((x + self.extent) // self.cellSize)
+        j = int((y + self.extent) // self.cellSize)
+        i = min(max(i, 0), self.size - 1)
+        j = min(max(j, 0), self.size - 1)
+        return i, j
+
+    def move(self, item, x, y):
+        # Insert item, or move it if it has changed cell
+        cell = self.cellOf(x, y)
+        old = self.cells.get(item)
+        if old == cell:
+            return
+        if old is not None:
+            self.buckets[old].discard(item)
+        self.cells[item] = cell
+        bucket = self.buckets.get(cell)
+        if bucket is None:
+            bucket = self.buckets[cell] = set()
+        bucket.add(item)
+
+    def remove(self, item):
+        cell = self.cells.pop(item, None)
+        if cell is not None:
+            self.buckets[cell].discard(item)
+
+    def clear(self):
+        self.buckets = {}
+        self.cells = {}
+
+    def query(self, x, y):
+        # Return every item in the cell containing x, y and its neighbours
+        ci, cj = self.cellOf(x, y)
+        found = []
+        for i in range(ci - 1, ci + 2):
+            for j in range(cj - 1, cj + 2):
+                bucket = self.buckets.get((i, j))
+                if bucket:
+                    found.extend(bucket)
+        return found
@@ -1,9 +1,17 @@
+import os
+
 from direct.gui.DirectGui import DGG
 from direct.gui.DirectGui import DirectFrame, DirectButton, DirectEntry
 from direct.gui.OnscreenText import OnscreenText, Vec3, TextNode
 from direct.showbase.DirectObject import DirectObject
+from panda3d.core import ConfigVariableString
 
+from assets import loadTextureInBackground
 from client import Client
+from matchmaking import masterPort, masterServer
+
+# where the token to take our centipede back after a dropped connection is kept
+resumeTokenFile = ConfigVariableString('resume-token-file', 'resume-token')
 
 
 class Start(DirectObject):
@@ -12,14 +20,17 @@ class Start(DirectObject):
 
         self.showbase = main
 
+        # the login form is up before the background has been read
         self.background = DirectFrame(
             frameSize=(-1, 1, -1, 1),
-            frameTexture='media/gui/login/bg.png',
+            frameColor=(0, 0, 0, 1),
             parent=self.showbase.render2d,
         )
+        loadTextureInBackground(self.showbase, 'media/gui/login/bg.png', self.setBackground)
 
         self.username = "H3LLB0Y"
-        self.server = "localhost"
+        # with a master server the box holds the master, which picks the game server
+        self.server = masterServer.getValue() or "localhost"
 
         self.loginScreen("Press 'Enter' to login")
         # draws the login screen
@@ -40,11 +51,20 @@ class Start(DirectObject):
 
         self.updateStatus("Type Server and Connect!")
 
+    def setBackground(self, texture):
+        if self.background:
+            self.background['frameTexture'] = texture
+            # back to the DirectFrame default the texture was drawn with
+            self.background['frameColor'] = (0.8, 0.8, 0.8, 1)
+
     def cleanup(self):
         self.ignoreAll()
         self.removeAllTasks()
+        self.showbase.taskMgr.remove('Match Listener')
+        self.showbase.taskMgr.remove('Load media/gui/login/bg.png')
 
         self.background.destroy()
+        self.background = None
         self.usernameText.destroy()
         self.usernameBox.destroy()
         self.serverText.destroy()
@@ -126,17 +146,54 @@ class Start(DirectObject):
     def attemptConnect(self):
         if self.checkBoxes():
             self.updateStatus("Attempting to connect...")
-            self.joinServer(self.serverBox.get(), self.usernameBox.get())
+            if masterServer.getValue():
+                self.findMatch(self.serverBox.get(), self.usernameBox.get())
+            else:
+                self.joinServer(self.serverBox.get(), self.usernameBox.get())
+
+    def findMatch(self, masterIp, username):
+        self.showbase.username = username
+        self.updateStatus('Asking ' + masterIp + ' for a match')
+        self.master = Client(masterIp, masterPort.getValue(), compress=True)
+        if self.master.connected:
+            self.master.sendData(('match', username))
+            self.showbase.taskMgr.add(self.matchListener, 'Match Listener')
+        else:
+            self.updateStatus('Could not Connect...')
+
+    def matchListener(self, task):
+        for package in self.master.getData():
+            if len(package) == 2:
+                if package[0] == 'queued':
+                    self.updateStatus('Waiting for a match, %d in the queue' % package[1])
+                elif package[0] == 'ticket':
+                    host, port, ticket = package[1]
+                    self.master.close()
+                    self.master = None
+                    self.joinServer(host, self.showbase.username, port, ticket)
+                    return task.done
+        return task.again
 
-    def joinServer(self, serverIp, username):
+    def joinServer(self, serverIp, username, port=9099, ticket=None):
         self.ip = serverIp
+        self.address = '%s:%d' % (serverIp, port)
         self.showbase.username = username
-        self.updateStatus('Attempting to join server: ' + serverIp)
+        self.updateStatus('Attempting to join server: ' + self.address)
         # attempt to connect to the game server
-        self.showbase.client = Client(self.ip, 9099, compress=True)
+        self.showbase.client = Client(self.ip, port, compress=True)
         if self.showbase.client.connected:
             print 'Connected to server, Awaiting authentication...'
-            self.showbase.client.sendData(('username', self.showbase.username))
+            token = self.loadResumeToken(self.address, self.showbase.username)
+            if ticket:
+                # the server only takes the token if we are still in its round
+                if token:
+                    self.showbase.client.sendData(('ticket', (self.showbase.username, ticket, token)))
+                else:
+                    self.showbase.client.sendData(('ticket', (self.showbase.username, ticket)))
+            elif token:
+                self.showbase.client.sendData(('resume', (self.showbase.username, token)))
+            else:
+                self.showbase.client.sendData(('username', self.showbase.username))
             self.showbase.taskMgr.add(self.authorizationListener, 'Authorization Listener')
         else:
             self.updateStatus('Could not Connect...')
@@ -149,8 +206,11 @@ class Start(DirectObject):
                 if len(package) == 2:
                     if package[0] == 'auth':
                         print 'Authentication Successful'
+                        self.saveResumeToken(self.address, package[1][0], package[1][1])
                         auth = True
                     elif package[0] == 'fail':
+                        # a refused token is no good for the next attempt either
+                        self.dropResumeToken()
                         self.updateStatus('Username already taken...')
                         return task.done
                     else:
@@ -160,6 +220,30 @@ class Start(DirectObject):
             return task.done
         return task.again
 
+    def loadResumeToken(self, address, username):
+        # Token handed out by the same server to the same player, if any
+        try:
+            with open(resumeTokenFile.getValue()) as tokenFile:
+                server, name, token = tokenFile.read().split()
+        except (IOError, ValueError):
+            return None
+        if server == address and name == username:
+            return token
+        return None
+
+    def saveResumeToken(self, address, username, token):
+        try:
+            with open(resumeTokenFile.getValue(), 'w') as tokenFile:
+                tokenFile.write('%s %s %s\n' % (address, username, token))
+        except IOError:
+            print 'Could not save resume token'
+
+    def dropResumeToken(self):
+        try:
+            os.remove(resumeTokenFile.getValue())
+        except OSError:
+            pass
+
     def cycleLoginBox(self):
         # function is triggered by the tab key so you can cycle between
         # the two input fields like on most login screens
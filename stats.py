@@ -0,0 +1,21 @@
+# PlayerStats Class
+# What one player did during a round, counted by the simulation.
+class PlayerStats(object):
+    def __init__(self):
+        self.kills = 0
+        self.deaths = 0
+        self.food = 0
+        self.maxLength = 0
+
+    def ate(self, length):
+        self.food += 1
+        self.maxLength = max(self.maxLength, length)
+
+    def died(self):
+        self.deaths += 1
+
+    def killed(self):
+        self.kills += 1
+
+    def getResult(self):
+        return self.kills, self.deaths, self.food, self.maxLength
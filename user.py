@@ -5,3 +5,9 @@ class User(object):
         self.connection = connection
         self.ready = False
         self.sync = False
+        self.loadProgress = 0.0
+        self.gameData = None
+        # lets the player take their place back after a dropped connection
+        self.token = None
+        # updates waiting to be bundled to this player during a round
+        self.sendQueue = None
@@ -17,3 +17,7 @@ class UserData(object):
             if packet[0] == 'updateDest':
                 self.centipede.setDestination(packet[1])
                 self.newDest = True
+            elif packet[0] == 'updateState':
+                self.centipede.applyStateUpdate(packet[1])
+            elif packet[0] == 'updateSnapshot':
+                self.centipede.applyCorrection(packet[1])
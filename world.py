@@ -1,12 +1,16 @@
+from assets import modelPath
+
+
 # World Class
 # TODO: Revisit parent class
 class World(object):
-    def __init__(self, showbase):
+    def __init__(self, showbase, parent):
         # Load the environment model (Ground and Surrounding Rocks)
-        self.ground = showbase.loader.loadModel('models/arena')
+        # The arena never moves so it is cached flattened
+        self.ground = showbase.loader.loadModel(modelPath('models/arena', flatten=True))
         # Reparent the model to render
-        self.ground.reparentTo(showbase.render)
+        self.ground.reparentTo(parent)
 
     def destroy(self):
-        self.ground.detachNode()
+        self.ground.removeNode()
         self.ground = None